@@ -0,0 +1,146 @@
+# dataCache.py
+#
+# Bryan Daniels
+# 2026/10/17
+#
+# A size-bounded on-disk cache for parsed and binned neural recordings.
+#
+
+import os
+import shutil
+import hashlib
+import json
+import tempfile
+import numpy as np
+
+class neuralDataCache():
+    """
+    Stores named collections of numpy arrays on disk, one directory of
+    .npy files per entry, so that they can be loaded back (memory-mapped)
+    in milliseconds.
+
+    Entries are keyed by strings (see fileKey), and the least recently
+    used entries are removed whenever the total size of the cache exceeds
+    maxBytes.
+    """
+    def __init__(self,cacheDir,maxBytes=2**32):
+        """
+        cacheDir                : Directory in which to store the cache.
+                                  Created if it does not exist.
+        maxBytes (2**32)        : Maximum total size of cached arrays
+        """
+        self.cacheDir = cacheDir
+        self.maxBytes = maxBytes
+        os.makedirs(cacheDir,exist_ok=True)
+        self._hashFilename = os.path.join(cacheDir,'fileHashes.json')
+
+    def fileHash(self,filename):
+        """
+        SHA-1 hash of the contents of the given file.
+
+        Hashes are remembered (in the cache directory) for each file path,
+        size, and modification time, so that an unchanged file is only
+        read once.
+        """
+        stat = os.stat(filename)
+        fileId = '{} {} {}'.format(os.path.abspath(filename),
+                                   stat.st_size,stat.st_mtime_ns)
+        knownHashes = self._readJSON(self._hashFilename)
+        if fileId not in knownHashes:
+            sha = hashlib.sha1()
+            with open(filename,'rb') as f:
+                for block in iter(lambda: f.read(2**20),b''):
+                    sha.update(block)
+            knownHashes[fileId] = sha.hexdigest()
+            self._writeJSON(self._hashFilename,knownHashes)
+        return knownHashes[fileId]
+
+    def fileKey(self,filename,*parameters):
+        """
+        Key for data derived from the given file's contents using the given
+        parameters (which should have a consistent repr).
+        """
+        description = repr((self.fileHash(filename),)+parameters)
+        return hashlib.sha1(description.encode()).hexdigest()
+
+    def load(self,key):
+        """
+        Return a dictionary of memory-mapped arrays saved under the given
+        key, or None if there is no such entry.
+        """
+        entryDir = os.path.join(self.cacheDir,key)
+        if not os.path.isdir(entryDir):
+            return None
+        arrays = {}
+        for filename in os.listdir(entryDir):
+            name,ext = os.path.splitext(filename)
+            if ext == '.npy':
+                arrays[name] = np.load(os.path.join(entryDir,filename),
+                                       mmap_mode='r')
+        # mark as recently used
+        os.utime(entryDir)
+        return arrays
+
+    def save(self,key,arrays):
+        """
+        Save a dictionary of arrays under the given key, then evict old
+        entries if the cache is too large.
+        """
+        tempDir = tempfile.mkdtemp(dir=self.cacheDir,prefix='.tmp')
+        for name,array in arrays.items():
+            np.save(os.path.join(tempDir,name+'.npy'),np.asarray(array))
+        entryDir = os.path.join(self.cacheDir,key)
+        try:
+            os.replace(tempDir,entryDir)
+        except OSError: # another process saved the same entry first
+            shutil.rmtree(tempDir,ignore_errors=True)
+        self.evict()
+
+    def evict(self):
+        """
+        Remove least recently used entries until the total size is at most
+        maxBytes.
+        """
+        entries = []
+        for key in os.listdir(self.cacheDir):
+            entryDir = os.path.join(self.cacheDir,key)
+            if key.startswith('.') or not os.path.isdir(entryDir):
+                continue
+            size = sum( os.path.getsize(os.path.join(entryDir,f))
+                        for f in os.listdir(entryDir) )
+            entries.append((os.path.getmtime(entryDir),size,entryDir))
+        totalSize = sum( size for lastUsed,size,entryDir in entries )
+        for lastUsed,size,entryDir in sorted(entries):
+            if totalSize <= self.maxBytes:
+                break
+            shutil.rmtree(entryDir,ignore_errors=True)
+            totalSize -= size
+
+    def clear(self):
+        """
+        Remove all entries.
+        """
+        shutil.rmtree(self.cacheDir,ignore_errors=True)
+        os.makedirs(self.cacheDir,exist_ok=True)
+
+    def _readJSON(self,filename):
+        try:
+            with open(filename) as f:
+                return json.load(f)
+        except (OSError,ValueError):
+            return {}
+
+    def _writeJSON(self,filename,data):
+        tempFilename = filename + '.tmp{}'.format(os.getpid())
+        with open(tempFilename,'w') as f:
+            json.dump(data,f)
+        os.replace(tempFilename,filename)
+
+def asCache(cache):
+    """
+    Return cache as a neuralDataCache, where cache may be a
+    neuralDataCache, the name of a cache directory, or None.
+    """
+    if cache is None or isinstance(cache,neuralDataCache):
+        return cache
+    return neuralDataCache(cache)
@@ -11,6 +11,14 @@
 # found in toolbox/informationDecomposition.
 
 import numpy as np
+import pandas as pd
+import scipy.special
+import scipy.integrate
+import scipy.spatial
+import functools
+import collections
+import hashlib
+import multiprocessing
 import warnings
 
 def arrayFlatten(arr):
@@ -35,9 +43,144 @@ def naiveEntropy(dist):
         ent = -np.sum( np.nan_to_num(dist*np.log2(dist)) )
     return ent
 
-# see EntropyEstimates.py for implementation
-def meanAndStdevEntropyNem():
-    raise Exception("NSB entropy estimates are not yet implemented.")
+# 10.17.2026
+# following EntropyEstimates.py
+def meanAndStdevEntropyNem(freqData,K=None,numGridPoints=400):
+    """
+    NSB estimate (Nemenman, Shafee, and Bialek 2002) of the entropy, in
+    bits, of a distribution over K states, with an estimate of its
+    standard deviation.
+    
+    freqData                : Number of samples observed in each state.
+                              States that are not listed (or have zero
+                              count) are assumed unobserved.
+    K (None)                : Total number of possible states.
+                              Defaults to len(freqData).
+    numGridPoints (400)     : Number of points used for numerical
+                              integration over the Dirichlet
+                              concentration parameter beta.
+    
+    All sums over states are computed from the histogram of counts
+    ("count of counts"), so the cost depends on the number of distinct
+    counts rather than on K or on the number of samples.  The posterior
+    over beta is first evaluated on a fixed logarithmic grid (cached
+    for each K and N), and then integrated on a finer grid around its
+    peak.
+    
+    Returns (mean,stdev).
+    """
+    freqData = np.asarray(freqData)
+    if K is None: K = len(freqData)
+    distinctCounts,multiplicities = np.unique(freqData[freqData > 0],
+                                              return_counts=True)
+    # (K may be a Python integer too large for numpy integer types)
+    numZeros = K - int(np.sum(multiplicities))
+    if numZeros < 0:
+        raise Exception("More states are observed than the given K.")
+    K,numZeros = float(K),float(numZeros)
+    N = int(np.sum(distinctCounts*multiplicities))
+    if N == 0:
+        return (np.nan,np.nan)
+    if K == 1:
+        return (0.,0.)
+    # treat unobserved states as one more distinct count (of zero)
+    counts = np.append(distinctCounts,0).astype(float)[:,np.newaxis]
+    multiplicities = np.append(multiplicities,numZeros).astype(float)
+    
+    # find the peak of the posterior over beta on the cached coarse grid
+    logBetas,logWeightsKN = _nsbGrid(K,N)
+    logWeights = logWeightsKN                                             \
+        + np.dot(multiplicities,scipy.special.gammaln(counts+np.exp(logBetas))
+                                - scipy.special.gammaln(np.exp(logBetas)))
+    important = np.flatnonzero(logWeights > np.max(logWeights) - 25.)
+    first,last = max(important[0]-1,0),min(important[-1]+1,len(logBetas)-1)
+    
+    # integrate on a fine grid around the peak
+    logBetas = np.linspace(logBetas[first],logBetas[last],numGridPoints)
+    logWeights,meanS,meanS2 =                                             \
+        _nsbIntegrands(np.exp(logBetas),K,N,counts,multiplicities)
+    weights = np.exp(logWeights - np.max(logWeights))
+    integrate = lambda f: scipy.integrate.trapezoid(weights*f,logBetas)
+    normalization = integrate(1.)
+    mean = integrate(meanS)/normalization
+    secondMoment = integrate(meanS2)/normalization
+    stdev = np.sqrt(max(secondMoment - mean**2,0.))
+    return (mean/np.log(2.),stdev/np.log(2.))
+
+@functools.lru_cache(maxsize=128)
+def _nsbGrid(K,N,numGridPoints=400):
+    """
+    Coarse logarithmic grid of Dirichlet concentration parameters beta
+    for NSB entropy estimation with K states and N samples, and the terms
+    of the log posterior density over log beta that depend only on K and
+    N (see _nsbIntegrands).
+    """
+    logBetas = np.linspace(np.log(1e-6/K),np.log(1e5),numGridPoints)
+    betas = np.exp(logBetas)
+    kappas = K*betas
+    # the NSB prior is uniform in the a priori expected entropy xi
+    dxidbeta = K*scipy.special.polygamma(1,kappas+1)                      \
+               - scipy.special.polygamma(1,betas+1)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore") # ignore "divide by zero" warnings
+        logWeightsKN = np.log(np.maximum(dxidbeta,0.)) + logBetas         \
+            + _logGammaRatio(kappas,N)
+    return logBetas,logWeightsKN
+
+def _logGammaRatio(kappas,N,largeKappa=1e4):
+    """
+    log(Gamma(kappa)/Gamma(N+kappa)), using Stirling's series for large
+    kappa, where the difference of gammaln values loses precision.
+    """
+    kappas = np.asarray(kappas,dtype=float)
+    large = kappas > largeKappa
+    ratio = np.empty_like(kappas)
+    k = kappas[~large]
+    ratio[~large] = scipy.special.gammaln(k) - scipy.special.gammaln(N+k)
+    k = kappas[large]
+    ratio[large] = - N*np.log(k) - (k+N-0.5)*np.log1p(N/k) + N            \
+                   + (1./k - 1./(N+k))/12.
+    return ratio
+
+def _nsbIntegrands(betas,K,N,counts,multiplicities):
+    """
+    For each beta, returns the log of the (unnormalized) posterior
+    density over log beta, and the posterior mean entropy and mean
+    squared entropy (in nats) given beta, for the given count of counts.
+    
+    counts                  : (#distinct counts)x1 array
+    multiplicities          : Number of states with each count
+    """
+    psi = scipy.special.digamma
+    trigamma = lambda x: scipy.special.polygamma(1,x)
+    kappas = K*betas
+    nb = counts + betas           # (#distinct counts)x(#betas)
+    Nk = N + kappas
+    
+    # log evidence plus log prior (over log beta)
+    dxidbeta = K*trigamma(kappas+1) - trigamma(betas+1)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore") # ignore "divide by zero" warnings
+        logWeights = np.log(np.maximum(dxidbeta,0.)) + np.log(betas)      \
+            + _logGammaRatio(kappas,N)                                    \
+            + np.dot(multiplicities,scipy.special.gammaln(nb)
+                                    - scipy.special.gammaln(betas))
+    
+    # E[S|beta]
+    meanS = psi(Nk+1) - np.dot(multiplicities,nb*psi(nb+1))/Nk
+    
+    # E[S^2|beta] (Wolpert and Wolf 1995), writing the sum over pairs of
+    # distinct states i != j as (sum over i)^2 minus the sum over i = j
+    psiNk2,trigammaNk2 = psi(Nk+2),trigamma(Nk+2)
+    a = nb*(psi(nb+1) - psiNk2)
+    sumA = np.dot(multiplicities,a)
+    sumA2 = np.dot(multiplicities,a**2)
+    sumNb2 = np.dot(multiplicities,nb**2)
+    diagonal = np.dot(multiplicities,nb*(nb+1)*( (psi(nb+2) - psiNk2)**2
+                                    + trigamma(nb+2) - trigammaNk2 ))
+    meanS2 = ( sumA**2 - sumA2 - trigammaNk2*(Nk**2 - sumNb2) + diagonal )\
+             / (Nk*(Nk+1))
+    return logWeights,meanS,meanS2
 
 # 7.20.2012
 class infoContainer():
@@ -52,20 +195,11 @@ class infoContainer():
         else:
             trialVals = self.trialValues
             
-        # taken from EntropyEstimates.fights2kxnx "efficient version"
-        tvSorted = np.sort(trialVals)
-        diffJumpLocs = find( (tvSorted[1:]-tvSorted[:-1])>0. )
-        nList = list( diffJumpLocs[1:]-diffJumpLocs[:-1] )
-        if len(diffJumpLocs) > 0:
-            # add for beginning and end
-            nList.insert(0,diffJumpLocs[0]+1)
-            nList.append(len(trialVals)-diffJumpLocs[-1]-1)
-        else: # all values are equal
-            nList.append(len(trialVals))
+        nVec = _stateCounts(trialVals)
             
         if possibleValues is not None:
-            nList = np.array(nList) - 1
-        self.nVec = np.array(nList)
+            nVec = nVec - 1
+        self.nVec = nVec
     
     def _setupEmpty(self,):
         self.trialValues = []
@@ -84,21 +218,44 @@ class infoContainer():
                               the naive method when there are at
                               least 10 samples for every possibility.
         """
-        if hasattr(self,'savedEntropy'):
-            return self.savedEntropy
+        # entropies are saved separately for each estimation method
+        if not hasattr(self,'savedEntropies'):
+            self.savedEntropies = {}
+        if naive in self.savedEntropies:
+            return self.savedEntropies[naive]
         if self.numTrials == 0:
             return (np.nan,np.nan)
         if naive is None:
-            naive = np.all(self.nVec > 10)
-        if naive:
+            method = np.all(self.nVec > 10)
+        else:
+            method = naive
+        if method:
             entropy = (naiveEntropy(self.nVec/float(sum(self.nVec))),0.)
         else:
-            #entropy = meanAndStdevEntropyNem(self.nVec,K=self.maxVal)
-            raise Exception("NSB entropy estimates are not yet implemented.")
-        if save: self.savedEntropy = entropy
+            entropy = meanAndStdevEntropyNem(self.nVec,K=self.maxVal)
+        if save: self.savedEntropies[naive] = entropy
         return entropy
   
 
+def _stateCounts(trialValues,maxDenseStates=2**20):
+    """
+    Number of trials with each distinct value, ordered by value.
+    
+    Small nonnegative integer values are counted with np.bincount; other
+    values (including exact codes for high-dimensional binary data) are
+    counted with a hash table, so that the cost is linear in the number
+    of trials.
+    """
+    values = np.asarray(trialValues)
+    if len(values) == 0:
+        return np.array([0])
+    if np.issubdtype(values.dtype,np.integer) and np.min(values) >= 0 \
+        and np.max(values) < max(maxDenseStates,len(values)):
+        counts = np.bincount(values)
+        return counts[counts > 0]
+    counts = pd.Series(values).value_counts(sort=False,dropna=False)
+    return counts.sort_index().values.astype(int)
+
 # 7.20.2012
 class binaryInfo(infoContainer):
     def __init__(self,binaryData,maxVal=None):
@@ -106,13 +263,16 @@ class binaryInfo(infoContainer):
         binaryData          : (#trials)x(#dimensions)
         maxVal (None)       : Maximum representable number.
                               Defaults to 2^(#dimensions).
+        
+        Each trial's state is coded exactly as an integer (see
+        binaryToDecimal), for any number of dimensions.
         """
         if np.prod(np.shape(binaryData)) == 0:
             self._setupEmpty()
             return
         b = np.array(binaryData,dtype=int)
-        if     (max(arrayFlatten(b)) > 1)              \
-            or (min(arrayFlatten(b)) < 0):
+        if     (np.max(b) > 1)                         \
+            or (np.min(b) < 0):
             raise Exception("binaryData is not in a recognized binary format.")
         if len(np.shape(b)) == 1:
             N = len(b)
@@ -128,10 +288,29 @@ class binaryInfo(infoContainer):
         self._calculateNvec()
     
 def binaryToDecimal(binaryData):
-    # taken from SparsenessTools.fight2number
-    return np.sum(                                       \
-        2**np.arange(float(len(binaryData[0])))[::-1]    \
-        * np.array(binaryData), axis=1 )
+    """
+    Exact integer code for each row of binaryData, reading the row as a
+    binary number (with the first column most significant).
+    
+    Codes are int64 for up to 63 columns.  Longer rows are packed into
+    multiple 63-bit words that are combined into Python integers,
+    returned in an array of dtype object.
+    """
+    b = np.array(binaryData,dtype=np.int64)
+    numTrials,numDimensions = b.shape
+    wordLength = 63
+    numWords = max(1,-(-numDimensions//wordLength))
+    # pad on the left, so that the last word holds the least significant bits
+    padded = np.zeros((numTrials,numWords*wordLength),dtype=np.int64)
+    padded[:,numWords*wordLength-numDimensions:] = b
+    bitValues = np.left_shift(1,np.arange(wordLength-1,-1,-1,dtype=np.int64))
+    words = np.dot(padded.reshape(numTrials,numWords,wordLength),bitValues)
+    if numWords == 1:
+        return words[:,0]
+    codes = words[:,0].astype(object)
+    for word in range(1,numWords):
+        codes = codes*2**wordLength + words[:,word].astype(object)
+    return codes
 
 # 7.20.2012
 class discreteInfo(infoContainer):
@@ -188,10 +367,18 @@ class jointInfo(infoContainer):
         IC1vals, IC2vals = IC1.trialValues, IC2.trialValues
         if len(IC1vals) != len(IC2vals):
             raise Exception("infoContainers must have equal numbers of trials")
-        self.maxVal = IC1.maxVal * IC2.maxVal
+        self.maxVal = int(IC1.maxVal) * int(IC2.maxVal)
         
-        self.trialValues =                                      \
-            IC1.maxVal*IC2.trialValues + IC1.trialValues
+        if self.maxVal <= np.iinfo(np.int64).max:
+            self.trialValues = IC1.maxVal*np.asarray(IC2vals,dtype=np.int64) \
+                               + np.asarray(IC1vals,dtype=np.int64)
+        else:
+            # the joint code would overflow, so instead label joint
+            # states by combining indices of the distinct values of each
+            # (which identify the same joint states)
+            indices1,values1 = pd.factorize(np.asarray(IC1vals))
+            indices2,values2 = pd.factorize(np.asarray(IC2vals))
+            self.trialValues = len(values1)*indices2 + indices1
         self.numTrials = len(self.trialValues)
         self._calculateNvec()
         
@@ -216,6 +403,153 @@ class conditionalInfo(infoContainer):
         self._calculateNvec(possibleValues=range(ICX.maxVal))
         
         
+# 10.17.2026
+class incrementalInfo(infoContainer):
+    """
+    An infoContainer whose trials can be added and removed, e.g. to
+    slide a window over time bins or accumulate sessions.
+    
+    Counts are kept in a histogram (a dictionary mapping states to
+    counts) along with a running sum of n*log(n), so that updates and
+    naive entropy estimates cost time proportional to the number of
+    trials added or removed rather than the total number of trials.
+    
+    Unlike other infoContainers, incrementalInfo does not store
+    trialValues, so it cannot be used with jointInfo, conditionalInfo,
+    or contingencyTable.  Use incrementalMutualInfo for mutual
+    information.
+    """
+    def __init__(self,discreteData=[],maxVal=None):
+        """
+        discreteData ([])   : Initial data.  length = #trials, or
+                              (#trials)x(#dimensions), in which case
+                              each distinct row is a state.
+        maxVal (None)       : Number of possible states, used for NSB
+                              entropy estimates.  Defaults to the
+                              number of distinct states currently
+                              observed.
+        """
+        self.counts = {}
+        self.numTrials = 0
+        self._maxVal = maxVal
+        self._sumNLogN = 0.
+        self.addTrials(discreteData)
+    
+    @property
+    def maxVal(self):
+        if self._maxVal is None:
+            return len(self.counts)
+        return self._maxVal
+    
+    @property
+    def nVec(self):
+        return np.array(list(self.counts.values()),dtype=int)
+    
+    def addTrials(self,discreteData):
+        self._update(_stateKeys(discreteData),1)
+    
+    def removeTrials(self,discreteData):
+        """
+        Remove trials with the given values (which must have been added).
+        """
+        self._update(_stateKeys(discreteData),-1)
+    
+    def _update(self,keys,sign):
+        changes = collections.Counter(keys)
+        if sign < 0:
+            for key,numTrials in changes.items():
+                if numTrials > self.counts.get(key,0):
+                    raise Exception("Cannot remove more trials with value "
+                                    "{} than were added".format(key))
+        for key,numTrials in changes.items():
+            oldCount = self.counts.get(key,0)
+            newCount = oldCount + sign*numTrials
+            self._sumNLogN += _nLogN(newCount) - _nLogN(oldCount)
+            if newCount == 0:
+                del self.counts[key]
+            else:
+                self.counts[key] = newCount
+            self.numTrials += sign*numTrials
+        if self.numTrials == 0:
+            # avoid accumulating roundoff error
+            self._sumNLogN = 0.
+    
+    def calculateEntropy(self,naive=True):
+        """
+        naive (True)        : True uses naive entropy estimation
+                              (computed from running sums).  False
+                              uses NSB entropy estimation.  None uses
+                              the naive method when there are at
+                              least 10 samples for every possibility.
+        """
+        if self.numTrials == 0:
+            return (np.nan,np.nan)
+        if naive is None:
+            naive = np.all(self.nVec > 10)
+        if naive:
+            N = float(self.numTrials)
+            return (np.log2(N) - self._sumNLogN/N,0.)
+        return meanAndStdevEntropyNem(self.nVec,K=self.maxVal)
+
+def _nLogN(n):
+    return n*np.log2(n) if n > 0 else 0.
+
+def _stateKeys(discreteData):
+    """
+    Hashable state for each trial of discreteData (see incrementalInfo).
+    """
+    data = np.asarray(discreteData)
+    if data.ndim > 1:
+        return [ tuple(row) for row in data.tolist() ]
+    return data.tolist()
+
+# 10.17.2026
+class incrementalMutualInfo():
+    """
+    Mutual information between two discrete variables for a set of
+    trials that can be added and removed, using incrementalInfo for
+    each variable and for their joint state.
+    
+    Example (sliding a window of 100 trials):
+        info = incrementalMutualInfo(dataX[:100],dataY[:100])
+        for i in range(100,len(dataX)):
+            info.removeTrials(dataX[i-100:i-99],dataY[i-100:i-99])
+            info.addTrials(dataX[i:i+1],dataY[i:i+1])
+            print(info.mutualInfo())
+    """
+    def __init__(self,dataX=[],dataY=[],maxValX=None,maxValY=None):
+        self.infoX = incrementalInfo(maxVal=maxValX)
+        self.infoY = incrementalInfo(maxVal=maxValY)
+        self.infoXY = incrementalInfo()
+        self.addTrials(dataX,dataY)
+    
+    def addTrials(self,dataX,dataY):
+        self._update(dataX,dataY,1)
+    
+    def removeTrials(self,dataX,dataY):
+        self._update(dataX,dataY,-1)
+    
+    def _update(self,dataX,dataY,sign):
+        keysX,keysY = _stateKeys(dataX),_stateKeys(dataY)
+        if len(keysX) != len(keysY):
+            raise Exception("dataX and dataY must have equal numbers of trials")
+        # (update the joint state first, since it fails if removing
+        # trials that were not added)
+        self.infoXY._update(list(zip(keysX,keysY)),sign)
+        self.infoX._update(keysX,sign)
+        self.infoY._update(keysY,sign)
+    
+    def mutualInfo(self,**kwargs):
+        """
+        kwargs are passed to calculateEntropy.
+        """
+        if self.infoX._maxVal is not None and self.infoY._maxVal is not None:
+            self.infoXY._maxVal = self.infoX._maxVal*self.infoY._maxVal
+        S1 = self.infoX.calculateEntropy(**kwargs)
+        S2 = self.infoY.calculateEntropy(**kwargs)
+        S12 = self.infoXY.calculateEntropy(**kwargs)
+        return S1[0] + S2[0] - S12[0]
+
 # 7.20.2012
 def mutualInfo(infoContainer1,infoContainer2,verbose=False,
     returnStds=False,**kwargs):
@@ -224,8 +558,12 @@ def mutualInfo(infoContainer1,infoContainer2,verbose=False,
                               standard deviations for
                               S1, S2, and S12.
                               (requires NSB entropy estimation)
+    
+    For infoContainers from the shared information cache (as used by
+    discreteMutualInfo), the joint infoContainer (and so its entropy) is
+    also cached, so repeated calls do not recount joint states.
     """
-    ICboth = jointInfo(infoContainer1,infoContainer2)
+    ICboth = _cachedJointInfo(infoContainer1,infoContainer2)
     S1 = infoContainer1.calculateEntropy(**kwargs)
     if verbose: print("S1,stdS1 =",S1)
     S2 = infoContainer2.calculateEntropy(**kwargs)
@@ -247,12 +585,109 @@ def discreteMutualInfo(data1,data2,maxVal1=None,maxVal2=None,**kwargs):
     
     maxVals are passed to the discreteInfo function, and other kwargs
     are passed to the mutualInfo function.
+    
+    infoContainers for each dataset are kept in the shared information
+    cache (see infoCache), so entropies of data seen before are reused.
     """
     assert(len(data1)==len(data2))
-    info1 = discreteInfo(data1,maxVal=maxVal1)
-    info2 = discreteInfo(data2,maxVal=maxVal2)
+    info1 = _cachedDiscreteInfo(data1,maxVal=maxVal1)
+    info2 = _cachedDiscreteInfo(data2,maxVal=maxVal2)
     return mutualInfo(info1,info2,**kwargs)
     
+# 10.17.2026
+def continuousMutualInfo(data1,data2,method='ksg',k=3,numBins=10,**kwargs):
+    """
+    Using data sampled simultaneously from two continuous distributions,
+    return an estimate in bits of the mutual information between the two
+    distributions.
+    
+    data1 and data2 should have the same length (#trials), and may be
+    multivariate, with shape (#trials)x(#dimensions).
+    
+    method ('ksg')      : 'ksg' uses the k-nearest-neighbor estimator
+                          of Kraskov, Stoegbauer, and Grassberger (see
+                          ksgMutualInfo), with other kwargs passed to
+                          ksgMutualInfo.  'binned' bins one-dimensional
+                          data into numBins equal-width bins (see
+                          continuousInfo), with other kwargs passed to
+                          mutualInfo.
+    k (3)               : Number of neighbors for the 'ksg' method
+    numBins (10)        : Number of bins for the 'binned' method
+    """
+    assert(len(data1)==len(data2))
+    if method == 'ksg':
+        return ksgMutualInfo(data1,data2,k=k,**kwargs)
+    elif method == 'binned':
+        info1 = continuousInfo(data1,numBins)
+        info2 = continuousInfo(data2,numBins)
+        return mutualInfo(info1,info2,**kwargs)
+    else:
+        raise Exception("Unrecognized method: "+str(method))
+
+def ksgMutualInfo(data1,data2,k=3,normalize=True,noise=1e-10,seed=0,
+    workers=-1):
+    """
+    Estimate in bits of the mutual information between two continuous
+    (possibly multivariate) variables, using the k-nearest-neighbor
+    estimator of Kraskov, Stoegbauer, and Grassberger 2004 (their
+    algorithm 1, using the maximum norm).
+    
+    Neighbors are found using KD-trees, so that the cost scales as
+    #trials*log(#trials).
+    
+    data1, data2            : length = #trials, or
+                              (#trials)x(#dimensions)
+    k (3)                   : Number of nearest neighbors in the joint
+                              space.  Larger k gives lower variance but
+                              more bias.
+    normalize (True)        : If True, first scale each dimension to
+                              unit standard deviation (the maximum
+                              norm is sensitive to relative scales).
+    noise (1e-10)           : Standard deviation of noise added to
+                              (normalized) data to break ties between
+                              repeated values
+    seed (0)                : Seed for the random number generator
+                              used to add noise
+    workers (-1)            : Number of threads used for neighbor
+                              queries.  -1 uses all CPUs.
+    """
+    rng = np.random.default_rng(seed)
+    dataList = []
+    for data in [data1,data2]:
+        data = np.array(data,dtype=float)
+        if data.ndim == 1:
+            data = data[:,np.newaxis]
+        if normalize:
+            stds = np.std(data,axis=0)
+            data = data/np.where(stds > 0,stds,1.)
+        if noise > 0:
+            data = data + noise*rng.standard_normal(data.shape)
+        dataList.append(data)
+    data1,data2 = dataList
+    numTrials = len(data1)
+    if len(data2) != numTrials:
+        raise Exception("data1 and data2 must have equal numbers of trials")
+    if k >= numTrials:
+        raise Exception("k must be less than the number of trials")
+    
+    # distance to the kth neighbor in the joint space (the nearest
+    # "neighbor" found is each point itself)
+    jointData = np.hstack([data1,data2])
+    distances,indices = scipy.spatial.cKDTree(jointData).query(jointData,
+        k=[k+1],p=np.inf,workers=workers)
+    radii = np.nextafter(distances[:,0],0)
+    
+    # number of points strictly within that distance in each marginal
+    # space, not counting each point itself
+    neighborCounts = [ scipy.spatial.cKDTree(data).query_ball_point(data,
+                         radii,p=np.inf,workers=workers,return_length=True)
+                       - 1 for data in [data1,data2] ]
+    
+    psi = scipy.special.digamma
+    MI = psi(k) + psi(numTrials)                                          \
+         - np.mean(psi(neighborCounts[0]+1) + psi(neighborCounts[1]+1))
+    return MI/np.log(2.)
+
 def discreteJointInfo(data1,data2,data3,maxVal1=None,maxVal2=None,
     maxVal3=None,**kwargs):
     """
@@ -277,37 +712,179 @@ def discreteJointInfo(data1,data2,data3,maxVal1=None,maxVal2=None,
     
     return mutualInfo(info1,jointInfo(info2,info3),**kwargs)
 
-def specificInfo(infoContainerY,infoContainerX,stateIndexY):
+# 10.17.2026
+def contingencyTable(*infoContainers):
     """
-    As defined in Timme et al. 2014, equation (29).
+    Count the number of trials in which each combination of states
+    occurs.
     
-    Uses naive frequencies as probability estimates.
+    Returns an integer array with one axis per infoContainer, of length
+    infoContainer.maxVal, indexed by the state index of each
+    infoContainer (its trialValues).  The table is built with a single
+    np.bincount over combined state codes.
+    """
+    numTrialsList = [ len(IC.trialValues) for IC in infoContainers ]
+    if len(set(numTrialsList)) > 1:
+        raise Exception("infoContainers must have equal numbers of trials")
+    shape = tuple( int(IC.maxVal) for IC in infoContainers )
+    stateIndices = tuple( np.asarray(IC.trialValues).astype(np.int64)
+                          for IC in infoContainers )
+    codes = np.ravel_multi_index(stateIndices,shape)
+    return np.bincount(codes,minlength=int(np.prod(shape))).reshape(shape)
+
+def _naiveEntropyFromCounts(counts,axis=None):
+    """
+    Naive entropy in bits of the distribution(s) given by counts, summing
+    over the given axis (or all axes if None).
+    """
+    counts = np.asarray(counts,dtype=float)
+    total = np.sum(counts,axis=axis)
+    with warnings.catch_warnings():
+        # ignore "divide by zero" and "invalid value" warnings
+        warnings.simplefilter("ignore")
+        nLogN = np.sum(np.where(counts > 0,counts*np.log2(counts),0.),axis=axis)
+        return np.where(total > 0,np.log2(total) - nLogN/total,np.nan)
+
+def mutualInfoFromTable(tableXY):
+    """
+    Naive mutual information in bits between the variables indexing the
+    rows and columns of the 2-dimensional contingency table tableXY.
     
-    Currently only works with discreteInfo infoContainers.
+    Any leading axes index separate tables (as for the other
+    ...FromTable functions), giving an array of mutual informations.
     """
-    pY = infoContainerY.nVec/float(sum(infoContainerY.nVec))
-    pStateY = pY[stateIndexY]
+    return _naiveEntropyFromCounts(np.sum(tableXY,axis=-1),axis=-1)       \
+         + _naiveEntropyFromCounts(np.sum(tableXY,axis=-2),axis=-1)       \
+         - _naiveEntropyFromCounts(tableXY,axis=(-2,-1))
+
+def mutualInfoScan(dataXArray,dataY,maxTableSize=2**24):
+    """
+    Naive mutual information in bits between dataY and each of many
+    discrete variables, equivalent to calling discreteMutualInfo for each
+    but computed with batched np.bincount operations.
     
-    # pXgivenStateY is indexed by X states
-    infoXgivenStateY = conditionalInfo(infoContainerX,infoContainerY,stateIndexY)
-    pXgivenStateY = infoXgivenStateY.nVec/float(sum(infoXgivenStateY.nVec))
+    dataXArray              : Array of discrete data with trials along
+                              the last axis, e.g. the
+                              (#neural units)x(#times)x(#trials) counts
+                              of a binnedCounts object
+    dataY                   : length = #trials
+    maxTableSize (2**24)    : Variables are processed in chunks with
+                              joint tables of at most about this many
+                              entries in total, to bound memory use.
     
-    # pStateYgivenX is also indexed by X states
-    pStateYgivenX = []
-    possibleStateIndicesX = range(infoContainerX.maxVal)
-    for stateIndexX in possibleStateIndicesX:
-        infoYgivenStateX = conditionalInfo(infoContainerY,infoContainerX,stateIndexX)
-        pYgivenStateX = infoYgivenStateX.nVec/float(sum(infoYgivenStateX.nVec))
-        pStateYgivenStateX = pYgivenStateX[stateIndexY]
-        pStateYgivenX.append(pStateYgivenStateX)
+    Returns an array of mutual informations with shape
+    dataXArray.shape[:-1].
+    """
+    dataXArray = np.asarray(dataXArray)
+    if dataXArray.shape[-1] != len(dataY):
+        raise Exception("The last axis of dataXArray should have length "
+                        "#trials")
+    outputShape = dataXArray.shape[:-1]
+    numTrials = len(dataY)
+    stateIndicesX,maxValX = _stateIndexArray(dataXArray.reshape(-1,numTrials))
+    infoContainerY = discreteInfo(dataY)
+    maxValY = infoContainerY.maxVal
+    stateIndicesY = np.asarray(infoContainerY.trialValues,dtype=np.int64)
+    SY = _naiveEntropyFromCounts(np.bincount(stateIndicesY,minlength=maxValY))
+    
+    tableSize = maxValX*maxValY
+    numVariables = len(stateIndicesX)
+    variablesPerChunk = max(1,maxTableSize//max(tableSize,numTrials))
+    MI = np.empty(numVariables)
+    for first in range(0,numVariables,variablesPerChunk):
+        chunk = stateIndicesX[first:first+variablesPerChunk]
+        numChunk = len(chunk)
+        rowOffsets = tableSize*np.arange(numChunk)[:,np.newaxis]
+        countsYX = np.bincount(np.ravel(rowOffsets + chunk*maxValY
+                                        + stateIndicesY),
+            minlength=numChunk*tableSize).reshape(numChunk,maxValX,maxValY)
+        MI[first:first+numChunk] = SY                                     \
+            + _naiveEntropyFromCounts(np.sum(countsYX,axis=2),axis=1)     \
+            - _naiveEntropyFromCounts(countsYX.reshape(numChunk,-1),axis=1)
+    return MI.reshape(outputShape)
+
+def _stateIndexArray(data):
+    """
+    Returns an int64 array of state indices with the same shape as data,
+    and the number of possible state indices.
+    
+    Nonnegative integer data (like spike counts) are used directly as
+    state indices; other data are mapped to the indices of their
+    distinct values.
+    """
+    data = np.asarray(data)
+    if not ( np.issubdtype(data.dtype,np.integer)
+             and np.min(data,initial=0) >= 0 ):
+        values,inverse = np.unique(data,return_inverse=True)
+        data = inverse.reshape(data.shape)
+    stateIndices = data.astype(np.int64)
+    return stateIndices,int(np.max(stateIndices,initial=0)) + 1
+
+def specificInfoFromTable(tableYX):
+    """
+    Specific information (Timme et al. 2014, equation (29)) that X gives
+    about each state of Y, using naive frequencies as probability
+    estimates.
     
+    tableYX             : (#Y states)x(#X states) contingency table
+                          (see contingencyTable)
+    
+    Returns an array of length #Y states.  States of Y that never occur
+    have specific information 0.
+    """
+    tableYX = np.asarray(tableYX,dtype=float)
+    nY = np.sum(tableYX,axis=-1,keepdims=True)
+    nX = np.sum(tableYX,axis=-2,keepdims=True)
     with warnings.catch_warnings():
         # ignore "divide by zero" and "invalid value" warnings
         warnings.simplefilter("ignore")
-        si = np.sum( np.nan_to_num(
-            pXgivenStateY * ( - np.log2(pStateY) + np.log2(pStateYgivenX) ) ) )
+        pXgivenY = tableYX/nY
+        pYgivenX = tableYX/nX
+        pY = nY/np.sum(nY,axis=-2,keepdims=True)
+        terms = pXgivenY * ( - np.log2(pY) + np.log2(pYgivenX) )
+    return np.sum(np.where(tableYX > 0,terms,0.),axis=-1)
+
+def redundancyFromTables(tableYX1,tableYX2):
+    """
+    Redundant information (Timme et al. 2014, equation (31)) from the
+    contingency tables of Y with X1 and of Y with X2.
+    """
+    nY = np.sum(tableYX1,axis=-1)
+    pY = nY/np.sum(nY,axis=-1,keepdims=True).astype(float)
+    return np.sum( pY * np.minimum(specificInfoFromTable(tableYX1),
+                                   specificInfoFromTable(tableYX2)), axis=-1 )
+
+def partialInfoFromTable(tableYX1X2):
+    """
+    Williams and Beer decomposition of the information that X1 and X2
+    give about Y, from their 3-dimensional contingency table (see
+    contingencyTable), using naive frequencies as probability estimates.
+    
+    Returns redundancy, unique info. for X1, unique info. for X2, and
+    synergy, as given in Timme et al. 2014, equations (31-34).  If
+    tableYX1X2 has more than 3 dimensions, leading axes index separate
+    tables, and each term is returned as an array.
+    """
+    tableYX1X2 = np.asarray(tableYX1X2)
+    tableYX1 = np.sum(tableYX1X2,axis=-1)
+    tableYX2 = np.sum(tableYX1X2,axis=-2)
+    R = redundancyFromTables(tableYX1,tableYX2)
+    MI1 = mutualInfoFromTable(tableYX1)
+    MI2 = mutualInfoFromTable(tableYX2)
+    tableYX1X2joint = tableYX1X2.reshape(tableYX1X2.shape[:-2]+(-1,))
+    joint = mutualInfoFromTable(tableYX1X2joint)
+    return R, MI1 - R, MI2 - R, joint - MI1 - MI2 + R
+
+def specificInfo(infoContainerY,infoContainerX,stateIndexY):
+    """
+    As defined in Timme et al. 2014, equation (29).
+    
+    Uses naive frequencies as probability estimates.
     
-    return si
+    Currently only works with discreteInfo infoContainers.
+    """
+    tableYX = contingencyTable(infoContainerY,infoContainerX)
+    return specificInfoFromTable(tableYX)[stateIndexY]
    
 def redundancy(dataY,dataX1,dataX2):
     """
@@ -317,14 +894,7 @@ def redundancy(dataY,dataX1,dataX2):
     
     Currently only works with discrete datasets.
     """
-    assert(len(dataY)==len(dataX1))
-    assert(len(dataY)==len(dataX2))
-    
-    infoContainerY = discreteInfo(dataY)
-    infoContainerX1 = discreteInfo(dataX1)
-    infoContainerX2 = discreteInfo(dataX2)
-    
-    return redundancyContainer(infoContainerY,infoContainerX1,infoContainerX2)
+    return decompose(dataY,dataX1,dataX2)['redundancy']
 
 def redundancyContainer(infoContainerY,infoContainerX1,infoContainerX2):
     """
@@ -334,14 +904,9 @@ def redundancyContainer(infoContainerY,infoContainerX1,infoContainerX2):
     
     Currently only works with discrete infoContainers.
     """
-    pY = infoContainerY.nVec/float(sum(infoContainerY.nVec))
-    Imin = 0
-    possibleStateIndicesY = range(infoContainerY.maxVal)
-    for stateIndexY in possibleStateIndicesY:
-        specificInfoX1 = specificInfo(infoContainerY,infoContainerX1,stateIndexY)
-        specificInfoX2 = specificInfo(infoContainerY,infoContainerX2,stateIndexY)
-        Imin += pY[stateIndexY] * min(specificInfoX1,specificInfoX2)
-    return Imin
+    return redundancyFromTables(
+        contingencyTable(infoContainerY,infoContainerX1),
+        contingencyTable(infoContainerY,infoContainerX2))
 
 def unique(dataY,dataX1,dataX2):
     """
@@ -352,17 +917,8 @@ def unique(dataY,dataX1,dataX2):
     
     Currently only works with discrete datasets.
     """
-    assert(len(dataY)==len(dataX1))
-    assert(len(dataY)==len(dataX2))
-    
-    infoContainerY = discreteInfo(dataY)
-    infoContainerX1 = discreteInfo(dataX1)
-    infoContainerX2 = discreteInfo(dataX2)
-    
-    R = redundancyContainer(infoContainerY,infoContainerX1,infoContainerX2)
-    U1 = mutualInfo(infoContainerY,infoContainerX1) - R
-    U2 = mutualInfo(infoContainerY,infoContainerX2) - R
-    return U1,U2
+    terms = decompose(dataY,dataX1,dataX2)
+    return terms['unique 1'],terms['unique 2']
 
 def synergy(dataY,dataX1,dataX2):
     """
@@ -373,15 +929,505 @@ def synergy(dataY,dataX1,dataX2):
     
     Currently only works with discrete datasets.
     """
+    return decompose(dataY,dataX1,dataX2)['synergy']
+
+# 10.17.2026
+def decompose(dataY,dataX1,dataX2):
+    """
+    Calculate all terms of the Williams and Beer decomposition of the
+    information that X1 and X2 give about Y (Timme et al. 2014,
+    equations (31-34)), along with the mutual informations from which
+    they are derived.
+    
+    Uses naive frequencies as probability estimates.
+    
+    Currently only works with discrete datasets.
+    
+    infoContainers, contingency tables, specific information, and
+    mutual information are kept in the shared information cache (see
+    infoCache), keyed by the contents of the data, so that calls
+    sharing a dataset (e.g. the same Y with many pairs of neurons)
+    reuse them.
+    
+    Returns a pandas series with entries 'redundancy', 'unique 1',
+    'unique 2', 'synergy', 'mutual info 1' (between Y and X1),
+    'mutual info 2' (between Y and X2), and 'joint mutual info'
+    (between Y and the joint state of X1 and X2).
+    """
     assert(len(dataY)==len(dataX1))
     assert(len(dataY)==len(dataX2))
     
+    keyY,key1,key2 = _dataKey(dataY),_dataKey(dataX1),_dataKey(dataX2)
+    infoContainerY = _cachedDiscreteInfo(dataY,key=keyY)
+    infoContainerX1 = _cachedDiscreteInfo(dataX1,key=key1)
+    infoContainerX2 = _cachedDiscreteInfo(dataX2,key=key2)
+    
+    def tableYX(infoContainerX,keyX):
+        return _infoCache.get(('table',keyY,keyX),
+            lambda: contingencyTable(infoContainerY,infoContainerX))
+    def specificInfos(infoContainerX,keyX):
+        return _infoCache.get(('specificInfo',keyY,keyX),
+            lambda: specificInfoFromTable(tableYX(infoContainerX,keyX)))
+    def MI(infoContainerX,keyX):
+        return _infoCache.get(('mutualInfo',keyY,keyX),
+            lambda: mutualInfoFromTable(tableYX(infoContainerX,keyX)))
+    def jointMI():
+        table = contingencyTable(infoContainerY,infoContainerX1,
+                                 infoContainerX2)
+        return mutualInfoFromTable(table.reshape(len(table),-1))
+    
+    pY = infoContainerY.nVec/float(infoContainerY.numTrials)
+    R = np.sum( pY * np.minimum(specificInfos(infoContainerX1,key1),
+                                specificInfos(infoContainerX2,key2)) )
+    MI1,MI2 = MI(infoContainerX1,key1),MI(infoContainerX2,key2)
+    joint = _infoCache.get(('jointMutualInfo',keyY,key1,key2),jointMI)
+    return pd.Series({'redundancy':R,
+                      'unique 1':MI1 - R,
+                      'unique 2':MI2 - R,
+                      'synergy':joint - MI1 - MI2 + R,
+                      'mutual info 1':MI1,
+                      'mutual info 2':MI2,
+                      'joint mutual info':joint})
+
+# 10.17.2026
+class infoCache():
+    """
+    A size-bounded, in-memory cache of derived information quantities,
+    removing the least recently used entries when full.
+    
+    A single shared instance (see clearInfoCache) is used by
+    discreteMutualInfo, mutualInfo, decompose, and the functions that
+    call it.  Datasets are identified by a hash of their contents (see
+    _dataKey).
+    """
+    def __init__(self,maxSize=256):
+        self.maxSize = maxSize
+        self._entries = collections.OrderedDict()
+    
+    def get(self,key,calculate):
+        """
+        Return the value saved under key, or save and return calculate().
+        """
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            return self._entries[key]
+        value = calculate()
+        self._entries[key] = value
+        while len(self._entries) > self.maxSize:
+            self._entries.popitem(last=False)
+        return value
+    
+    def clear(self):
+        self._entries.clear()
+
+_infoCache = infoCache()
+
+def clearInfoCache():
+    """
+    Remove all entries from the shared information cache.
+    """
+    _infoCache.clear()
+
+def _dataKey(data):
+    """
+    Hashable key identifying the contents of an array of data.
+    """
+    arr = np.asarray(data)
+    if arr.dtype == object:
+        contents = repr(arr.tolist()).encode()
+    else:
+        contents = np.ascontiguousarray(arr).tobytes()
+    return (arr.dtype.str,arr.shape,hashlib.sha1(contents).hexdigest())
+
+def _cachedDiscreteInfo(data,maxVal=None,key=None):
+    if key is None: key = _dataKey(data)
+    cacheKey = ('discreteInfo',key,maxVal)
+    def calculate():
+        info = discreteInfo(data,maxVal=maxVal)
+        info._cacheKey = cacheKey
+        return info
+    return _infoCache.get(cacheKey,calculate)
+
+def _cachedJointInfo(infoContainer1,infoContainer2):
+    """
+    jointInfo of two infoContainers, kept in the shared information
+    cache only if both came from it (see _cachedDiscreteInfo), so that
+    the cache never holds references to other infoContainers.
+    """
+    key1 = getattr(infoContainer1,'_cacheKey',None)
+    key2 = getattr(infoContainer2,'_cacheKey',None)
+    calculate = lambda: jointInfo(infoContainer1,infoContainer2)
+    if key1 is None or key2 is None:
+        return calculate()
+    return _infoCache.get(('jointInfo',key1,key2),calculate)
+
+# 10.17.2026
+def pairwiseDecomposition(dataY,dataXArray,pairs=None,numProcesses=None,
+    maxTableSize=2**22):
+    """
+    Calculate the redundant, unique, and synergistic info. that each pair
+    of variables X1, X2 (e.g. neural units) gives about Y, as in
+    redundancy, unique, and synergy.
+    
+    Uses naive frequencies as probability estimates.
+    
+    Counts, specific information, and mutual information for each
+    variable are calculated once and reused for every pair in which it
+    appears; only the joint information of each pair with Y requires
+    counting trials again, which is done for many pairs at a time with
+    a single np.bincount.
+    
+    dataY                   : length = #trials
+    dataXArray              : (#variables)x(#trials) discrete data.  If a
+                              pandas dataframe, its index is used to
+                              label variables.
+    pairs (None)            : List of pairs (i,j) of variable positions.
+                              Defaults to all pairs with i < j.
+    numProcesses (None)     : Number of worker processes.  Defaults to
+                              the number of CPUs.  If 1, all pairs are
+                              run in the current process.
+    maxTableSize (2**22)    : Pairs are processed in chunks with joint
+                              tables of at most about this many entries
+                              in total, to bound memory use.
+    
+    Returns a pandas dataframe with one row per pair, indexed by
+    ('variable 1','variable 2'), and columns 'redundancy', 'unique 1',
+    'unique 2', and 'synergy'.
+    """
+    labels = list(getattr(dataXArray,'index',range(len(dataXArray))))
+    dataXArray = np.asarray(dataXArray)
+    if np.shape(dataXArray)[1] != len(dataY):
+        raise Exception("dataXArray should have shape (#variables)x(#trials)")
+    if pairs is None:
+        pairs = np.transpose(np.triu_indices(len(dataXArray),k=1))
+    pairs = np.array(pairs,dtype=int).reshape(-1,2)
+    
+    # quantities for single variables
     infoContainerY = discreteInfo(dataY)
-    infoContainerX1 = discreteInfo(dataX1)
-    infoContainerX2 = discreteInfo(dataX2)
-    
-    joint = mutualInfo(infoContainerY,jointInfo(infoContainerX1,infoContainerX2))
-    MI1 = mutualInfo(infoContainerY,infoContainerX1)
-    MI2 = mutualInfo(infoContainerY,infoContainerX2)
-    R = redundancyContainer(infoContainerY,infoContainerX1,infoContainerX2)
-    return joint - MI1 - MI2 + R
+    infoContainersX = [ discreteInfo(dataX) for dataX in dataXArray ]
+    tablesYX = [ contingencyTable(infoContainerY,infoContainerX)
+                 for infoContainerX in infoContainersX ]
+    pY = np.sum(tablesYX[0],axis=1)/float(len(dataY))
+    specificInfos = np.array([ specificInfoFromTable(tableYX)
+                               for tableYX in tablesYX ])
+    MIs = np.array([ mutualInfoFromTable(tableYX) for tableYX in tablesYX ])
+    
+    # redundancy for all pairs at once
+    R = np.sum( pY * np.minimum(specificInfos[pairs[:,0]],
+                                specificInfos[pairs[:,1]]), axis=1 )
+    
+    # joint information with Y, in chunks of pairs
+    stateIndicesY = np.asarray(infoContainerY.trialValues,dtype=np.int64)
+    stateIndicesX = np.array([ IC.trialValues for IC in infoContainersX ],
+                             dtype=np.int64)
+    maxVals = np.array([ IC.maxVal for IC in infoContainersX ],dtype=np.int64)
+    tableSize = max(infoContainerY.maxVal*np.max(maxVals,initial=1)**2,
+                    len(dataY))
+    pairsPerChunk = max(1,maxTableSize//tableSize)
+    tasks = [ (stateIndicesY,infoContainerY.maxVal,
+               stateIndicesX[chunk[:,0]],stateIndicesX[chunk[:,1]],
+               maxVals[chunk[:,0]],maxVals[chunk[:,1]])
+              for chunk in np.split(pairs,
+                  range(pairsPerChunk,len(pairs),pairsPerChunk)) ]
+    if numProcesses == 1 or len(tasks) <= 1:
+        jointMIList = [ _pairwiseJointInfo(task) for task in tasks ]
+    else:
+        with multiprocessing.Pool(numProcesses) as pool:
+            jointMIList = pool.map(_pairwiseJointInfo,tasks)
+    jointMI = np.concatenate(jointMIList)
+    
+    MI1,MI2 = MIs[pairs[:,0]],MIs[pairs[:,1]]
+    index = pd.MultiIndex.from_tuples(
+        [ (labels[i],labels[j]) for i,j in pairs ],
+        names=['variable 1','variable 2'])
+    return pd.DataFrame({'redundancy':R,
+                         'unique 1':MI1 - R,
+                         'unique 2':MI2 - R,
+                         'synergy':jointMI - MI1 - MI2 + R},
+                        index=index)
+
+def _pairwiseJointInfo(task):
+    """
+    Naive mutual information between Y and the joint state of each pair
+    of variables in a chunk of pairs (see pairwiseDecomposition).
+    (Defined at the module level so that it can be sent to worker
+    processes.)
+    """
+    stateIndicesY,maxValY,stateIndicesX1,stateIndicesX2,maxVals1,maxVals2 \
+        = task
+    numPairs = len(stateIndicesX1)
+    # code joint states of X1 and X2, then of Y, X1, and X2, separately
+    # for each pair
+    maxValsX1X2 = (maxVals1*maxVals2)[:,np.newaxis]
+    codesX1X2 = stateIndicesX1*maxVals2[:,np.newaxis] + stateIndicesX2
+    codesYX1X2 = stateIndicesY*maxValsX1X2 + codesX1X2
+    tableSize = maxValY*int(np.max(maxValsX1X2,initial=1))
+    rowOffsets = tableSize*np.arange(numPairs)[:,np.newaxis]
+    countsX1X2 = np.bincount(np.ravel(rowOffsets + codesX1X2),
+        minlength=numPairs*tableSize).reshape(numPairs,tableSize)
+    countsYX1X2 = np.bincount(np.ravel(rowOffsets + codesYX1X2),
+        minlength=numPairs*tableSize).reshape(numPairs,tableSize)
+    SY = _naiveEntropyFromCounts(np.bincount(stateIndicesY,minlength=maxValY))
+    return SY + _naiveEntropyFromCounts(countsX1X2,axis=1)               \
+              - _naiveEntropyFromCounts(countsYX1X2,axis=1)
+
+# 10.17.2026
+def permutationTest(dataY,dataX1,dataX2=None,numPermutations=1000,
+    quantiles=[0.05,0.5,0.95],seed=0,numProcesses=None,
+    permutationsPerChunk=100,returnNull=False):
+    """
+    Test the significance of the mutual information between Y and X1,
+    or, if dataX2 is given, of each term of the decomposition of the
+    information that X1 and X2 give about Y, by comparing to a null
+    distribution in which Y is shuffled across trials.
+    
+    Uses naive frequencies as probability estimates.
+    
+    Permutations are generated in chunks as (#permutations)x(#trials)
+    index arrays, and contingency tables for all permutations in a chunk
+    are counted with a single np.bincount.
+    
+    numPermutations (1000)      : Number of shuffles of Y
+    quantiles ([0.05,0.5,0.95]) : Quantiles of the null distribution to
+                                  report
+    seed (0)                    : Each chunk of permutations is drawn
+                                  from its own random stream, derived
+                                  from seed and the chunk's position, so
+                                  that results do not depend on
+                                  numProcesses.
+    numProcesses (None)         : Number of worker processes.  Defaults
+                                  to the number of CPUs.  If 1, all
+                                  chunks are run in the current process.
+    permutationsPerChunk (100)  : Number of permutations per chunk
+    returnNull (False)          : Also return the null distribution as
+                                  a (#permutations)x(#terms) array.
+    
+    Returns a pandas dataframe with one row per term ('mutual info', or
+    'redundancy', 'unique 1', 'unique 2', and 'synergy'), and columns
+    'observed', 'p-value', and one for each quantile of the null
+    distribution.  The p-value is the (one-sided) fraction of
+    permutations, counting the observed data as one, giving a value at
+    least as large as observed.
+    """
+    assert(len(dataY)==len(dataX1))
+    infoContainers = [ discreteInfo(dataY),discreteInfo(dataX1) ]
+    if dataX2 is not None:
+        assert(len(dataY)==len(dataX2))
+        infoContainers.append(discreteInfo(dataX2))
+    terms = _infoTermNames(len(infoContainers))
+    stateIndices = [ np.asarray(IC.trialValues,dtype=np.int64)
+                     for IC in infoContainers ]
+    shape = tuple( IC.maxVal for IC in infoContainers )
+    table = contingencyTable(*infoContainers)
+    observed = _infoTerms(table[np.newaxis])[0]
+    
+    chunkSizes = [ min(permutationsPerChunk,numPermutations-first)
+                   for first in range(0,numPermutations,permutationsPerChunk) ]
+    tasks = [ (chunk,chunkSize,stateIndices,shape,seed)
+              for chunk,chunkSize in enumerate(chunkSizes) ]
+    if numProcesses == 1 or len(tasks) <= 1:
+        nullList = [ _permutationChunk(task) for task in tasks ]
+    else:
+        with multiprocessing.Pool(numProcesses) as pool:
+            nullList = pool.map(_permutationChunk,tasks)
+    null = np.concatenate(nullList)
+    
+    # allow for roundoff when comparing to the observed value
+    atLeastObserved = null >= observed - 1e-12
+    pValues = (1. + np.sum(atLeastObserved,axis=0))/(1. + numPermutations)
+    df = pd.DataFrame({'observed':observed,'p-value':pValues},index=terms)
+    for q in quantiles:
+        df['null {}'.format(q)] = np.quantile(null,q,axis=0)
+    if returnNull:
+        return df,null
+    return df
+
+def _infoTermNames(numVariables):
+    return { 1:['entropy'],
+             2:['mutual info'],
+             3:['redundancy','unique 1','unique 2','synergy'] }[numVariables]
+
+def _infoTerms(tables):
+    """
+    Entropy (for 1 variable), mutual information (for 2 variables), or
+    decomposition terms (for 3 variables) for contingency tables indexed
+    by a leading axis, as a (#tables)x(#terms) array.
+    """
+    if np.ndim(tables) == 2:
+        return _naiveEntropyFromCounts(tables,axis=-1)[:,np.newaxis]
+    if np.ndim(tables) == 3:
+        return mutualInfoFromTable(tables)[:,np.newaxis]
+    return np.transpose(partialInfoFromTable(tables))
+
+def _permutationChunk(task):
+    """
+    Null distribution for one chunk of permutations (see
+    permutationTest).  (Defined at the module level so that it can be
+    sent to worker processes.)
+    """
+    chunk,numPermutations,stateIndices,shape,seed = task
+    # derive an independent random stream for this chunk
+    chunkSeed = np.random.SeedSequence(seed,spawn_key=(chunk,))
+    rng = np.random.default_rng(chunkSeed)
+    stateIndicesY = stateIndices[0]
+    numTrials = len(stateIndicesY)
+    permutations = np.argsort(rng.random((numPermutations,numTrials)),axis=1)
+    # combined codes for each permutation, with Y shuffled
+    tableSize = int(np.prod(shape))
+    codes = np.ravel_multi_index((stateIndicesY[permutations],)
+                                 + tuple(stateIndices[1:]),shape)
+    codes += tableSize*np.arange(numPermutations)[:,np.newaxis]
+    tables = np.bincount(np.ravel(codes),minlength=numPermutations*tableSize)
+    return _infoTerms(tables.reshape((numPermutations,)+shape))
+
+# 10.17.2026
+def bootstrapInfo(*infoContainers,numBootstraps=1000,confidence=0.95,seed=0,
+    returnSamples=False):
+    """
+    Bootstrap confidence intervals for the entropy of a single
+    infoContainer, the mutual information between two infoContainers,
+    or the terms of the decomposition of the information that the
+    second and third of three infoContainers give about the first (as in
+    redundancy, unique, and synergy).
+    
+    Uses naive frequencies as probability estimates.
+    
+    Instead of resampling trials, each bootstrap sample is a
+    multinomial draw of #trials counts over the cells of the observed
+    contingency table, which has the same distribution, so that all
+    samples are generated and evaluated at once.
+    
+    numBootstraps (1000)    : Number of bootstrap samples
+    confidence (0.95)       : Confidence level of the (percentile)
+                              intervals
+    seed (0)                : Seed for the random number generator
+    returnSamples (False)   : Also return the bootstrap samples as a
+                              (#bootstraps)x(#terms) array.
+    
+    Returns a pandas dataframe with one row per term ('entropy',
+    'mutual info', or 'redundancy', 'unique 1', 'unique 2', and
+    'synergy'), and columns 'estimate', 'stdev' (of the bootstrap
+    samples), 'lower', and 'upper'.
+    """
+    if len(infoContainers) not in [1,2,3]:
+        raise Exception("bootstrapInfo takes 1, 2, or 3 infoContainers, not "\
+            +str(len(infoContainers)))
+    rng = np.random.default_rng(seed)
+    if len(infoContainers) == 1:
+        # only observed states are needed for the entropy
+        table = np.asarray(infoContainers[0].nVec)
+        table = table[table > 0]
+    else:
+        table = contingencyTable(*infoContainers)
+    numTrials = int(np.sum(table))
+    estimate = _infoTerms(table[np.newaxis])[0]
+    
+    samples = rng.multinomial(numTrials,np.ravel(table)/float(numTrials),
+                              size=numBootstraps)
+    samples = _infoTerms(samples.reshape((numBootstraps,)+table.shape))
+    
+    df = pd.DataFrame({'estimate':estimate,
+                       'stdev':np.std(samples,axis=0),
+                       'lower':np.quantile(samples,(1.-confidence)/2.,axis=0),
+                       'upper':np.quantile(samples,(1.+confidence)/2.,axis=0)},
+                      index=_infoTermNames(len(infoContainers)))
+    if returnSamples:
+        return df,samples
+    return df
+
+# 10.17.2026
+def laggedInfo(countsArray,lags=[1],numProcesses=None,maxTableSize=2**24):
+    """
+    Time-lagged mutual information and transfer entropy, in bits,
+    between every pair of (source, target) neural units.
+    
+    Uses naive frequencies as probability estimates.
+    
+    For a lag L, samples are taken from all trials and from all times t
+    with t-L >= 0 and t-1 >= 0, assuming stationarity across time bins.
+    The lagged mutual information is I( source(t-L) ; target(t) ), and
+    the transfer entropy, conditioning on the target's previous time
+    bin, is I( source(t-L) ; target(t) | target(t-1) ).
+    
+    For each source unit and lag, joint histograms of
+    (target(t),target(t-1),source(t-L)) for all target units are counted
+    with a single np.bincount.  Source units are split across processes.
+    
+    countsArray             : (#units)x(#times)x(#trials) array of
+                              discrete data, e.g. the counts of a
+                              binnedCounts object (see neuralData)
+    lags ([1])              : List of lags (in numbers of time bins)
+    numProcesses (None)     : Number of worker processes.  Defaults to
+                              the number of CPUs.  If 1, all source
+                              units are run in the current process.
+    maxTableSize (2**24)    : Target units are processed in chunks with
+                              joint tables of at most about this many
+                              entries in total, to bound memory use.
+    
+    Returns laggedMutualInfo,transferEntropy, each an array of shape
+    (#units)x(#units)x(#lags) indexed by [source,target,lag].
+    """
+    stateIndices,numStates = _stateIndexArray(countsArray)
+    if stateIndices.ndim != 3:
+        raise Exception("countsArray should have shape "
+                        "(#units)x(#times)x(#trials)")
+    numTimes = stateIndices.shape[1]
+    if np.max(lags) >= numTimes or np.min(lags) < 0:
+        raise Exception("lags should be between 0 and #times-1")
+    tasks = [ (source,lags,numStates,maxTableSize)
+              for source in range(len(stateIndices)) ]
+    if numProcesses == 1:
+        results = [ _laggedInfoSource(task,stateIndices) for task in tasks ]
+    else:
+        # send the data to each worker process once
+        with multiprocessing.Pool(numProcesses,initializer=_setLaggedInfoData,
+                                  initargs=(stateIndices,)) as pool:
+            results = pool.map(_laggedInfoSource,tasks)
+    laggedMutualInfo = np.array([ MI for MI,TE in results ])
+    transferEntropy = np.array([ TE for MI,TE in results ])
+    return laggedMutualInfo,transferEntropy
+
+_laggedInfoData = None
+
+def _setLaggedInfoData(stateIndices):
+    global _laggedInfoData
+    _laggedInfoData = stateIndices
+
+def _laggedInfoSource(task,stateIndices=None):
+    """
+    Lagged mutual information and transfer entropy from one source unit
+    to all target units (see laggedInfo), as two (#units)x(#lags)
+    arrays.  (Defined at the module level so that it can be sent to
+    worker processes, which use data set by _setLaggedInfoData.)
+    """
+    source,lags,K,maxTableSize = task
+    if stateIndices is None:
+        stateIndices = _laggedInfoData
+    numUnits,numTimes,numTrials = stateIndices.shape
+    tableSize = K**3
+    targetsPerChunk = max(1,maxTableSize//max(tableSize,
+                                              numTimes*numTrials))
+    MI = np.empty((numUnits,len(lags)))
+    TE = np.empty((numUnits,len(lags)))
+    for lagIndex,lag in enumerate(lags):
+        first = max(lag,1)
+        sourcePast = stateIndices[source,first-lag:numTimes-lag]
+        for firstTarget in range(0,numUnits,targetsPerChunk):
+            targets = slice(firstTarget,
+                            min(firstTarget+targetsPerChunk,numUnits))
+            targetNow = stateIndices[targets,first:]
+            targetPast = stateIndices[targets,first-1:numTimes-1]
+            numChunk = len(targetNow)
+            # code (target(t),target(t-1),source(t-L)) separately for
+            # each target
+            codes = (targetNow*K + targetPast)*K + sourcePast
+            codes += tableSize*np.arange(numChunk)[:,np.newaxis,np.newaxis]
+            tables = np.bincount(np.ravel(codes),
+                minlength=numChunk*tableSize).reshape(numChunk,K,K,K)
+            MI[targets,lagIndex] = mutualInfoFromTable(np.sum(tables,axis=2))
+            H = _naiveEntropyFromCounts
+            TE[targets,lagIndex] = H(np.sum(tables,axis=3),axis=(1,2))    \
+                                 + H(np.sum(tables,axis=1),axis=(1,2))    \
+                                 - H(tables,axis=(1,2,3))                 \
+                                 - H(np.sum(tables,axis=(1,3)),axis=1)
+    return MI,TE
@@ -9,9 +9,16 @@
 import numpy as np
 import pandas as pd
 import scipy.io
+try:
+    import h5py
+except ImportError: # h5py is only needed to read MATLAB v7.3 files
+    h5py = None
+
+from .dataCache import asCache
 
 def loadBinnedSpikingData(matFilename,alignName='go_cue',timeWindow=100,
-                          binRange=[-10,10],relativeMidTimes=None):
+                          binRange=[-10,10],relativeMidTimes=None,cache=None,
+                          asArray=False):
     """
     matFilename             : Name of MATLAB file to read in
     alignName ('go_cue')    : Name of time data with which to align trials.
@@ -26,25 +33,117 @@ def loadBinnedSpikingData(matFilename,alignName='go_cue',timeWindow=100,
                               corresponds to the align time.  Bins
                               are of width timeWindow centered
                               on each midTime.
+    cache (None)            : A neuralDataCache, or the name of a
+                              directory in which to keep one.  If
+                              given, parsed spike times, event times,
+                              and binned counts are saved there and
+                              reused whenever the same file contents
+                              are loaded with the same parameters.
+    asArray (False)         : If True, return a binnedCounts object
+                              instead of a pandas dataframe.
+    """
+    cache = asCache(cache)
+    relativeMidTimes = _relativeMidTimes(timeWindow,binRange,relativeMidTimes)
+    if cache is not None:
+        key = cache.fileKey(matFilename,'binned',alignName,float(timeWindow),
+                            tuple(np.ravel(relativeMidTimes).tolist()))
+        cached = cache.load(key)
+        if cached is not None:
+            return _binnedResult(np.array(cached['counts']),relativeMidTimes,
+                                 asArray)
+    
+    spikes_ragged = loadSpikeTimes(matFilename,cache=cache)
+    alignTimes = loadEventTimes(matFilename,alignName,cache=cache)
+    
+    binnedData = _binnedCounts(spikes_ragged,timeWindow,alignTimes,
+                               relativeMidTimes)
+    if cache is not None:
+        cache.save(key,{'counts':binnedData})
+    return _binnedResult(binnedData,relativeMidTimes,asArray)
+
+def loadMultiBinnedSpikingData(matFilename,
+    alignNames=['go_cue','dots_onset','dots_offset','sacc_onset'],
+    timeWindows=[100],binRange=[-10,10],relativeMidTimes=None,cache=None):
     """
-    matlabdata = scipy.io.loadmat(matFilename)
+    Bin spikes for every combination of the given alignment events and
+    time window lengths, reading the file once and counting all bins in
+    a single pass over the spike data.
+    
+    alignNames              : List of names of time data with which to
+                              align trials (see loadBinnedSpikingData)
+    timeWindows ([100])     : List of time window lengths (in ms)
     
-    spikes = matlabdata['spike_times']
-    spikes_flat = spikeTimesArray(spikes)
+    Other options are as in loadBinnedSpikingData.  See
+    multiBinnedSpikingData for the format of the returned dataframe.
+    """
+    cache = asCache(cache)
+    spikes_ragged = loadSpikeTimes(matFilename,cache=cache)
+    alignTimesDict = dict( (alignName,
+                            loadEventTimes(matFilename,alignName,cache=cache))
+                           for alignName in alignNames )
+    return multiBinnedSpikingData(spikes_ragged,timeWindows,alignTimesDict,
+                                  binRange,relativeMidTimes)
+
+def loadSpikeTimes(matFilename,cache=None):
+    """
+    Load spike times from a MATLAB file as raggedSpikeTimes.
     
-    alignTimes = np.ndarray.flatten(matlabdata['event_times'][alignName][0][0])
+    cache (None)            : See loadBinnedSpikingData.  Cached spike
+                              times are memory-mapped (read-only).
+    """
+    cache = asCache(cache)
+    if cache is not None:
+        key = cache.fileKey(matFilename,'spike_times')
+        cached = cache.load(key)
+        if cached is not None:
+            numTrials,numUnits = cached['shape']
+            return raggedSpikeTimes(cached['spikeTimes'],cached['offsets'],
+                                    numTrials,numUnits)
     
-    return binnedSpikingData(spikes_flat,timeWindow,alignTimes,
-                             binRange=binRange,relativeMidTimes=relativeMidTimes)
+    # read only the variable we need
+    matlabdata = scipy.io.loadmat(matFilename,variable_names=['spike_times'])
+    spikes_ragged = spikeTimesRagged(matlabdata['spike_times'])
+    if cache is not None:
+        cache.save(key,{'spikeTimes':spikes_ragged.spikeTimes,
+                        'offsets':spikes_ragged.offsets,
+                        'shape':np.array(spikes_ragged.shape)})
+    return spikes_ragged
 
-def loadBehaviorData(matFilename,name='chosen_target'):
-    matlabdata = scipy.io.loadmat(matFilename)
-    npdata = np.ndarray.flatten(matlabdata['trial_info'][name][0,0])
+def loadEventTimes(matFilename,alignName='go_cue',cache=None):
+    """
+    Load the times of the given event ('go_cue', 'dots_onset',
+    'dots_offset', or 'sacc_onset') for each trial from a MATLAB file.
+    
+    cache (None)            : See loadBinnedSpikingData.
+    """
+    return _loadStructField(matFilename,'event_times',alignName,cache)
+
+def loadBehaviorData(matFilename,name='chosen_target',cache=None):
+    npdata = _loadStructField(matFilename,'trial_info',name,cache)
     numTrials = len(npdata)
     return pd.Series(npdata,index=trialNames(numTrials))
 
-def trialNames(numTrials):
-    return ['Trial {}'.format(i) for i in range(numTrials)]
+def _loadStructField(matFilename,structName,fieldName,cache=None):
+    """
+    Load a field of a MATLAB struct as a flat numpy array, using the
+    cache if given.
+    """
+    cache = asCache(cache)
+    if cache is not None:
+        key = cache.fileKey(matFilename,structName,fieldName)
+        cached = cache.load(key)
+        if cached is not None:
+            return np.array(cached['data'])
+    
+    # read only the variable we need
+    matlabdata = scipy.io.loadmat(matFilename,variable_names=[structName])
+    npdata = np.ndarray.flatten(matlabdata[structName][fieldName][0,0])
+    if cache is not None:
+        cache.save(key,{'data':npdata})
+    return npdata
+
+def trialNames(numTrials,firstTrial=0):
+    return ['Trial {}'.format(i) for i in range(firstTrial,firstTrial+numTrials)]
 
 def spikeTimesArray(spikeTimeLists):
     """
@@ -65,12 +164,121 @@ def spikeTimesArray(spikeTimeLists):
                 np.ndarray.flatten(trialNeuronSpikes)
     return spikes_flat
 
+# 10.17.2026
+class raggedSpikeTimes():
+    """
+    Compact (CSR-style) storage of spike times for each
+    (trial)x(neural unit) combination.
+    
+    Spike times are stored in a single flat array, with spikes for each
+    combination contiguous and sorted in time.  Combinations are
+    indexed by row = trial*(#neural units) + unit, and the spikes for a
+    given row are spikeTimes[offsets[row]:offsets[row+1]].
+    
+    Unlike the NaN-padded arrays made by spikeTimesArray, memory use
+    does not depend on the number of spikes in the busiest unit.
+    """
+    def __init__(self,spikeTimes,offsets,numTrials,numUnits):
+        self.spikeTimes = np.asarray(spikeTimes,dtype=float)
+        self.offsets = np.asarray(offsets,dtype=np.int64)
+        self.numTrials = numTrials
+        self.numUnits = numUnits
+        if len(self.offsets) != numTrials*numUnits + 1:
+            raise Exception("offsets should have length #trials*#units + 1")
+    
+    @property
+    def shape(self):
+        return (self.numTrials,self.numUnits)
+    
+    def spikes(self,trial,unit):
+        """
+        Spike times for the given trial and neural unit
+        """
+        row = trial*self.numUnits + unit
+        return self.spikeTimes[self.offsets[row]:self.offsets[row+1]]
+    
+    def numSpikes(self):
+        """
+        (#trials)x(#neural units) array of spike counts
+        """
+        return np.diff(self.offsets).reshape(self.numTrials,self.numUnits)
+    
+    def rowIndices(self,firstRow=0,lastRow=None):
+        """
+        Row index for each spike in rows firstRow through lastRow-1
+        (defaulting to all rows).
+        """
+        if lastRow is None: lastRow = self.numTrials*self.numUnits
+        return np.repeat(np.arange(firstRow,lastRow),
+                         np.diff(self.offsets[firstRow:lastRow+1]))
+    
+    def toPaddedArray(self):
+        """
+        Convert to a NaN-padded array of shape
+        (#trials)x(#neural units)x(max # spikes), as returned by
+        spikeTimesArray.
+        """
+        numSpikes = np.diff(self.offsets)
+        maxLen = max(1,np.max(numSpikes,initial=0))
+        padded = np.nan*np.ones([self.numTrials*self.numUnits,maxLen])
+        positions = np.arange(len(self.spikeTimes)) \
+                    - np.repeat(self.offsets[:-1],numSpikes)
+        padded[self.rowIndices(),positions] = self.spikeTimes
+        return padded.reshape(self.numTrials,self.numUnits,maxLen)
+
+def _raggedFromRows(rows,times,numTrials,numUnits):
+    """
+    Build raggedSpikeTimes from the row index and time of each spike,
+    given in any order.
+    """
+    # (spike times from MATLAB files are typically already in order)
+    sameRow = rows[1:] == rows[:-1]
+    if np.any(rows[1:] < rows[:-1]) or np.any(sameRow & (times[1:] < times[:-1])):
+        order = np.lexsort((times,rows))
+        rows,times = rows[order],times[order]
+    numRows = numTrials*numUnits
+    offsets = np.concatenate([[0],np.cumsum(np.bincount(rows,minlength=numRows))])
+    return raggedSpikeTimes(times,offsets,numTrials,numUnits)
+
+def spikeTimesRagged(spikeTimeLists):
+    """
+    Convert spike time lists as given in MATLAB files (a (#trials)x(#neural
+    units) cell array) to raggedSpikeTimes.
+    """
+    cells = np.asarray(spikeTimeLists,dtype=object)
+    numTrials,numUnits = cells.shape[:2]
+    cellTimes = [ np.ravel(c) for c in cells.ravel() ]
+    numSpikes = np.fromiter(map(len,cellTimes),dtype=np.int64,count=len(cellTimes))
+    if len(cellTimes) > 0:
+        times = np.concatenate(cellTimes).astype(float)
+    else:
+        times = np.zeros(0)
+    rows = np.repeat(np.arange(numTrials*numUnits),numSpikes)
+    return _raggedFromRows(rows,times,numTrials,numUnits)
+
+def raggedSpikeTimesFromArray(allSpikeTimesArray):
+    """
+    Convert a NaN-padded spike time array, as returned by spikeTimesArray,
+    to raggedSpikeTimes.
+    """
+    spikeTimes = np.asarray(allSpikeTimesArray,dtype=float)
+    numTrials,numUnits,maxSpikes = spikeTimes.shape
+    rows = np.repeat(np.arange(numTrials*numUnits),maxSpikes)
+    times = spikeTimes.reshape(-1)
+    isSpike = ~np.isnan(times)
+    return _raggedFromRows(rows[isSpike],times[isSpike],numTrials,numUnits)
+
 def binnedSpikingData(allSpikeTimesArray,timeWindow,alignTimes,
-                      binRange=[-10,10],relativeMidTimes=None):
+                      binRange=[-10,10],relativeMidTimes=None,asArray=False):
     """
     Returns integer data representing how many times
     each neuron spiked within each window of time.
     
+    allSpikeTimesArray      : Spike times as raggedSpikeTimes (see
+                              spikeTimesRagged), or as a NaN-padded
+                              array with shape
+                              (#trials)x(#neural units)x(max # spikes),
+                              as returned by spikeTimesArray
     timeWindow              : length (in ms) of time window
                               (SchBerSeg06 uses 20 ms)
                               (I've been using 100 ms or 250 ms or 200 ms)
@@ -84,38 +292,347 @@ def binnedSpikingData(allSpikeTimesArray,timeWindow,alignTimes,
                               the binRange option.  Zero
                               corresponds to the align time.  Bins
                               are of width timeWindow centered
-                              on each midTime.
+                              on each midTime.  Bins may overlap.
+    asArray (False)         : If True, return a binnedCounts object
+                              (storing counts in a compact array)
+                              instead of a pandas dataframe.
+    
+    Spikes are sorted once, and then all bins for all units and trials
+    are counted using binary searches (see _windowCounts).
+    """
+    
+    relativeMidTimes = _relativeMidTimes(timeWindow,binRange,relativeMidTimes)
+    binnedData = _binnedCounts(allSpikeTimesArray,timeWindow,alignTimes,
+                               relativeMidTimes)
+    return _binnedResult(binnedData,relativeMidTimes,asArray)
+
+# 10.17.2026
+class binnedCounts():
+    """
+    Compact storage of binned spike counts, holding the same data as the
+    dataframe returned by binnedSpikingData.
+    
+    counts is a (#neural units)x(#times)x(#trials) array of the
+    smallest unsigned integer type that fits the counts (typically
+    uint8), so that the data for a single neural unit or time bin can be
+    accessed as a view without copying.
+    """
+    def __init__(self,counts,relativeMidTimes,firstTrial=0):
+        """
+        counts                  : (#neural units)x(#times)x(#trials)
+                                  array of spike counts
+        relativeMidTimes        : Bin centers (in ms) relative to the
+                                  align time
+        firstTrial (0)          : Index of the first trial (used to name
+                                  trials, see trialNames)
+        """
+        self.counts = np.asarray(counts)
+        self.times = np.asarray(relativeMidTimes)
+        self.firstTrial = firstTrial
+        if self.counts.ndim != 3 or len(self.times) != self.counts.shape[1]:
+            raise Exception("counts should have shape "
+                            "(#neural units)x(#times)x(#trials)")
+    
+    @property
+    def shape(self):
+        return self.counts.shape
+    
+    @property
+    def trials(self):
+        return trialNames(self.counts.shape[2],self.firstTrial)
+    
+    def unit(self,unit):
+        """
+        (#times)x(#trials) view of counts for the given neural unit
+        """
+        return self.counts[unit]
+    
+    def time(self,midTime):
+        """
+        (#neural units)x(#trials) view of counts for the time bin
+        centered at midTime (in ms)
+        """
+        timeIndices = np.flatnonzero(self.times == midTime)
+        if len(timeIndices) == 0:
+            raise Exception("No time bin centered at {}".format(midTime))
+        return self.counts[:,timeIndices[0],:]
+    
+    def toDataFrame(self):
+        """
+        Convert to the dataframe returned by binnedSpikingData.
+        """
+        return _binnedDataFrame(np.moveaxis(self.counts,2,0).astype(int),
+                                self.times,self.firstTrial)
+
+def multiBinnedSpikingData(allSpikeTimesArray,timeWindows,alignTimesDict,
+                           binRange=[-10,10],relativeMidTimes=None):
     """
+    Equivalent to calling binnedSpikingData for every combination of
+    alignment and time window, but with all bins counted in a single
+    pass over the spike data.
+    
+    allSpikeTimesArray      : Spike times as raggedSpikeTimes or as a
+                              NaN-padded array (see binnedSpikingData)
+    timeWindows             : List of time window lengths (in ms)
+    alignTimesDict          : Dictionary mapping alignment names to
+                              lists of times, one for each trial
+    binRange ([-10,10])     : As in binnedSpikingData.  Bin centers
+                              are spaced by each time window length.
+    relativeMidTimes (None) : As in binnedSpikingData.  If given, the
+                              same bin centers are used for every
+                              time window length.
+    
+    Returns a pandas dataframe with trials as columns (as in
+    binnedSpikingData) and index levels 'alignment', 'time window',
+    'neural unit', and 'time (ms)'.
+    """
+    if not isinstance(allSpikeTimesArray,raggedSpikeTimes):
+        allSpikeTimesArray = raggedSpikeTimesFromArray(allSpikeTimesArray)
+    
+    # lay out the bins for every combination side by side
+    combinations,startTimesList,widthsList = [],[],[]
+    for alignName,alignTimes in alignTimesDict.items():
+        for timeWindow in timeWindows:
+            midTimes = _relativeMidTimes(timeWindow,binRange,relativeMidTimes)
+            combinations.append((alignName,timeWindow,midTimes))
+            startTimesList.append(np.add.outer(np.asarray(alignTimes),
+                                               midTimes) - timeWindow/2.)
+            widthsList.append(timeWindow*np.ones(len(midTimes)))
+    counts = _windowCounts(allSpikeTimesArray,np.hstack(startTimesList),
+                           np.concatenate(widthsList))
+    
+    # split the counts back up by combination
+    dfList,firstBin = [],0
+    for alignName,timeWindow,midTimes in combinations:
+        lastBin = firstBin + len(midTimes)
+        dfList.append(_binnedDataFrame(counts[:,:,firstBin:lastBin],midTimes))
+        firstBin = lastBin
+    # (sort so that selecting one alignment and time window is fast)
+    df = pd.concat(dfList,
+                   keys=[ combination[:2] for combination in combinations ],
+                   names=['alignment','time window'])
+    return df.sort_index(level=['alignment','time window'],
+                         sort_remaining=False)
+
+# 10.17.2026
+class lazyRecording():
+    """
+    Reads a MATLAB recording file (containing spike_times, event_times,
+    and trial_info, as in the Kiani et al. data) lazily, a chunk of
+    trials at a time, so that large recordings can be processed in
+    bounded memory.
+    
+    Both MATLAB v5 files and v7.3 (HDF5) files are supported.  Reading
+    v7.3 files requires the h5py package.  For v7.3 files, only the
+    requested trials are read from disk.  v5 files do not support
+    partial reads, so for these the spike_times variable is read in full
+    the first time it is needed (but is still converted and binned one
+    chunk at a time).
+    
+    Example:
+        with lazyRecording(filename) as recording:
+            for chunk in recording.iterBinnedSpikingData(chunkSize=200):
+                ...
+    """
+    def __init__(self,matFilename):
+        self.matFilename = matFilename
+        with open(matFilename,'rb') as f:
+            self.isHDF5 = f.read(10) == b'MATLAB 7.3'
+        if self.isHDF5:
+            if h5py is None:
+                raise Exception("Reading MATLAB v7.3 files requires h5py.")
+            self._file = h5py.File(matFilename,'r')
+            # MATLAB stores arrays transposed in HDF5 files
+            self.numTrials,self.numUnits = self._file['spike_times'].shape[::-1]
+        else:
+            self._spikeTimeLists = None
+            shapes = { name:shape for name,shape,matlabClass in
+                       scipy.io.whosmat(matFilename) }
+            self.numTrials,self.numUnits = shapes['spike_times'][:2]
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self,*args):
+        self.close()
+    
+    def close(self):
+        if self.isHDF5:
+            self._file.close()
+        else:
+            self._spikeTimeLists = None
+    
+    def _structField(self,structName,fieldName):
+        if self.isHDF5:
+            return np.ndarray.flatten(self._file[structName][fieldName][()])
+        return _loadStructField(self.matFilename,structName,fieldName)
+    
+    def eventTimes(self,alignName='go_cue'):
+        """
+        Times of the given event for each trial (see loadEventTimes)
+        """
+        return self._structField('event_times',alignName)
+    
+    def behaviorData(self,name='chosen_target'):
+        """
+        Behavioral data for each trial (see loadBehaviorData)
+        """
+        return pd.Series(self._structField('trial_info',name),
+                         index=trialNames(self.numTrials))
+    
+    def spikeTimes(self,firstTrial=0,lastTrial=None):
+        """
+        raggedSpikeTimes for trials firstTrial through lastTrial-1
+        (defaulting to all trials)
+        """
+        if lastTrial is None: lastTrial = self.numTrials
+        if not self.isHDF5:
+            if self._spikeTimeLists is None:
+                self._spikeTimeLists = scipy.io.loadmat(self.matFilename,
+                    variable_names=['spike_times'])['spike_times']
+            return spikeTimesRagged(self._spikeTimeLists[firstTrial:lastTrial])
+        # each cell is a reference to a separate dataset
+        references = self._file['spike_times'][:,firstTrial:lastTrial].T
+        cells = np.empty(references.shape,dtype=object)
+        for index,reference in np.ndenumerate(references):
+            dataset = self._file[reference]
+            if dataset.attrs.get('MATLAB_empty',0):
+                cells[index] = np.zeros(0)
+            else:
+                cells[index] = dataset[()]
+        return spikeTimesRagged(cells)
     
+    def iterSpikeTimes(self,chunkSize=100):
+        """
+        Yields (firstTrial,raggedSpikeTimes) for consecutive chunks of
+        chunkSize trials.
+        """
+        for firstTrial in range(0,self.numTrials,chunkSize):
+            lastTrial = min(firstTrial+chunkSize,self.numTrials)
+            yield firstTrial,self.spikeTimes(firstTrial,lastTrial)
+    
+    def iterBinnedSpikingData(self,alignName='go_cue',timeWindow=100,
+        binRange=[-10,10],relativeMidTimes=None,chunkSize=100,asArray=False):
+        """
+        Yields binned spike counts for consecutive chunks of chunkSize
+        trials, each in the format returned by loadBinnedSpikingData
+        (with trials named by their index in the full recording).
+        """
+        relativeMidTimes = _relativeMidTimes(timeWindow,binRange,
+                                             relativeMidTimes)
+        alignTimes = self.eventTimes(alignName)
+        for firstTrial,spikes in self.iterSpikeTimes(chunkSize):
+            chunkAlignTimes = alignTimes[firstTrial:firstTrial+spikes.numTrials]
+            binnedData = _binnedCounts(spikes,timeWindow,chunkAlignTimes,
+                                       relativeMidTimes)
+            yield _binnedResult(binnedData,relativeMidTimes,asArray,firstTrial)
+
+def _relativeMidTimes(timeWindow,binRange,relativeMidTimes):
+    """
+    Bin centers relative to the align time (see binnedSpikingData).
+    """
     if relativeMidTimes is None:
         binNumbers = range(binRange[0],binRange[1]+1)
         binRelativeTimes = np.array(binNumbers)*timeWindow
         relativeMidTimes = binRelativeTimes
-    binnedData = []
-
-    for trialSpikeTimes,alignTime in                        \
-        zip(allSpikeTimesArray,alignTimes):
-            binnedTrialData = []
-            #timeBins = binRelativeTimes + alignTime
-            midTimes = relativeMidTimes + alignTime
-            startTimes = midTimes - timeWindow/2.
-            
-            # Messing around with arrays to make faster.
-            # Could be even better if you care to try...
-            for s in startTimes:
-                h = np.sum(np.logical_and(np.less(s,trialSpikeTimes),np.less(trialSpikeTimes,s+timeWindow)),axis=1)
-                binnedTrialData.append(h)
-            binnedData.append(np.transpose(binnedTrialData))
-    
-    binnedData = np.asarray(binnedData)
-    
+    return relativeMidTimes
+
+def _binnedCounts(allSpikeTimesArray,timeWindow,alignTimes,relativeMidTimes):
+    """
+    (#trials)x(#neural units)x(#times) array of spike counts
+    (see binnedSpikingData).
+    """
+    if not isinstance(allSpikeTimesArray,raggedSpikeTimes):
+        allSpikeTimesArray = raggedSpikeTimesFromArray(allSpikeTimesArray)
+    midTimes = np.add.outer(np.asarray(alignTimes),relativeMidTimes)
+    startTimes = midTimes - timeWindow/2.
+    return _windowCounts(allSpikeTimesArray,startTimes,timeWindow)
+
+def _binnedDataFrame(binnedData,relativeMidTimes,firstTrial=0):
+    """
+    Convert a (#trials)x(#neural units)x(#times) array of spike counts
+    to the dataframe returned by binnedSpikingData.  Trials are named
+    starting from firstTrial.
+    """
     # make pandas dataframe
     numTrials,numNeurons,numTimes = binnedData.shape
     idx = pd.MultiIndex.from_product([np.arange(numNeurons),relativeMidTimes],
         names=['neural unit','time (ms)'])
     df = pd.DataFrame(binnedData.reshape(numTrials,numNeurons*numTimes).T,
                       index=idx,
-                      columns=trialNames(numTrials))
+                      columns=trialNames(numTrials,firstTrial))
     
     return df
 
+def _binnedResult(binnedData,relativeMidTimes,asArray,firstTrial=0):
+    """
+    Convert a (#trials)x(#neural units)x(#times) array of spike counts
+    to a binnedCounts object if asArray is True, or else to the
+    dataframe returned by binnedSpikingData.
+    """
+    if not asArray:
+        return _binnedDataFrame(binnedData,relativeMidTimes,firstTrial)
+    maxCount = np.max(binnedData,initial=0)
+    for dtype in [np.uint8,np.uint16,np.uint32]:
+        if maxCount <= np.iinfo(dtype).max:
+            break
+    else:
+        dtype = np.uint64
+    counts = np.empty(np.roll(binnedData.shape,-1),dtype=dtype)
+    counts[:] = np.moveaxis(binnedData,0,2)
+    return binnedCounts(counts,relativeMidTimes,firstTrial)
+
+def _rowTimeKeys(rows,times):
+    """
+    Combine row indices and times into complex numbers row + i*time.
+    
+    numpy sorts and searches complex numbers lexicographically (by real
+    part, then imaginary part), so sorted keys list spikes grouped by row
+    and in time order within each row, and a single np.searchsorted can
+    then locate times within any number of different rows.
+    """
+    rows,times = np.broadcast_arrays(rows,times)
+    keys = np.empty(rows.shape,dtype=complex)
+    keys.real = rows
+    keys.imag = times
+    return keys
+
+def _windowCounts(spikes,startTimes,timeWindow,maxQueries=2**12):
+    """
+    Count spikes falling strictly inside each time window.
+    
+    spikes                  : raggedSpikeTimes
+    startTimes              : (#trials)x(#windows) array of window start
+                              times.  Windows may overlap.
+    timeWindow              : Length of the windows, or a list of
+                              lengths, one for each window
+    maxQueries (2**12)      : Trials are processed in blocks with at
+                              most about this many windows each, to
+                              bound memory use.
+    
+    Returns a (#trials)x(#units)x(#windows) integer array of the number
+    of spikes with start < t < start + timeWindow.
+    """
+    numTrials,numUnits = spikes.shape
+    startTimes = np.asarray(startTimes,dtype=float)
+    numWindows = startTimes.shape[1]
+    timeWindow = np.asarray(timeWindow,dtype=float)
+    counts = np.empty((numTrials,numUnits,numWindows),dtype=int)
+    trialsPerBlock = max(1,maxQueries//max(1,numUnits*numWindows))
+    units = np.arange(numUnits)
+    for firstTrial in range(0,numTrials,trialsPerBlock):
+        trials = np.arange(firstTrial,min(firstTrial+trialsPerBlock,numTrials))
+        rows = np.add.outer(trials*numUnits,units)[:,:,np.newaxis]
+        starts = startTimes[trials][:,np.newaxis,:]
+        # sorted keys for spikes in this block of trials (searching only
+        # among these is faster since they fit in cache)
+        firstRow,lastRow = trials[0]*numUnits,(trials[-1]+1)*numUnits
+        blockKeys = _rowTimeKeys(spikes.rowIndices(firstRow,lastRow),
+            spikes.spikeTimes[spikes.offsets[firstRow]:spikes.offsets[lastRow]])
+        # (number of spikes before the end) - (number up to the start)
+        numBeforeEnd = np.searchsorted(blockKeys,
+            _rowTimeKeys(rows,starts+timeWindow),side='left')
+        numUpToStart = np.searchsorted(blockKeys,
+            _rowTimeKeys(rows,starts),side='right')
+        counts[trials] = numBeforeEnd - numUpToStart
+    return counts
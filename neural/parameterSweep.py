@@ -0,0 +1,225 @@
+# parameterSweep.py
+#
+# Bryan Daniels
+# 2026/10/17
+#
+# Runs the simple neural decision model over grids of parameters, in
+# parallel and with checkpointing, collecting results into a single table.
+#
+
+import itertools
+import os
+import json
+import multiprocessing
+import numpy as np
+import pandas as pd
+
+from .simpleNeuralModel import simpleNeuralDynamicsEnsemble,          \
+                               simpleNeuralDecisions,                 \
+                               allToAllNetworkAdjacency,_numTimes
+
+sweepParameterNames = ['inputConst','noiseVar','coupling','N']
+
+def decisionSweep(inputConstList=[0.075],noiseVarList=[1],couplingList=[0.1],
+    NList=[100],numRuns=100,tFinal=10,deltat=1e-3,method='euler',
+    backend='numpy',decisionThreshold=None,seed=0,numProcesses=None,
+    checkpointFilename=None):
+    """
+    Simulate the decision dynamics of simpleNeuralDynamics on all-to-all
+    networks for every combination of the given parameters.
+    
+    Each combination of parameters (a "cell" of the grid) is simulated with
+    numRuns replicates, using the weight matrix
+    coupling*allToAllNetworkAdjacency(N).  The decision made in each run is
+    the sign of the mean neural state at time tFinal, and the decision is
+    counted as correct if it matches the sign of inputConst.
+    
+    If decisionThreshold is given, each run instead stops as soon as the
+    absolute value of its mean neural state reaches decisionThreshold (see
+    simpleNeuralDecisions), and the decision is made at that time.
+    
+    numRuns (100)               : Number of replicates per cell
+    method ('euler')            : Integration method passed to
+                                  simpleNeuralDynamicsEnsemble
+    backend ('numpy')           : Backend passed to
+                                  simpleNeuralDynamicsEnsemble
+    seed (0)                    : Each cell is simulated with its own random
+                                  stream, derived from seed and the cell's
+                                  position in the grid, so that results do
+                                  not depend on numProcesses or on the order
+                                  in which cells are run.  If None, a seed
+                                  is drawn once from the operating system
+                                  (and, with checkpointFilename, saved so
+                                  that a resumed sweep continues with it).
+    numProcesses (None)         : Number of worker processes.  Defaults to
+                                  the number of CPUs.  If 1, cells are run
+                                  serially in the current process.
+    checkpointFilename (None)   : If given, results for each completed cell
+                                  are appended to this CSV file, and cells
+                                  already completed in the file (with
+                                  numRuns complete rows) are not rerun.  An interrupted sweep can thus be
+                                  resumed by calling decisionSweep again
+                                  with the same arguments.  The non-grid
+                                  settings are saved alongside, in
+                                  checkpointFilename + '.json', and an
+                                  exception is raised if they or the grid
+                                  do not match those of the checkpoint.
+    
+    Returns a pandas dataframe with one row per run and columns
+    inputConst, noiseVar, coupling, N, cell, run, finalMeanState,
+    decision (+1 or -1), correct (nan when inputConst is 0), and
+    decisionTime (nan if decisionThreshold is None or was not reached).
+    
+    Decision accuracy for each cell can then be found using, e.g.,
+        df.groupby(['inputConst','noiseVar','coupling','N'])['correct'].mean()
+    """
+    grid = list(itertools.product(inputConstList,noiseVarList,
+                                  couplingList,NList))
+    
+    # find cells already completed in a previous call
+    resultList,completedCells = [],set()
+    if checkpointFilename is not None:
+        settingsFilename = checkpointFilename + '.json'
+        resuming = os.path.exists(checkpointFilename)
+        if resuming:
+            if not os.path.exists(settingsFilename):
+                raise Exception("Settings file {} for checkpoint file {} "
+                    "is missing.".format(settingsFilename,checkpointFilename))
+            with open(settingsFilename) as f:
+                previousSettings = json.load(f)
+            if seed is None:
+                # continue with the seed drawn when the sweep was started
+                seed = previousSettings['seed']
+    if seed is None:
+        # draw a single seed, so that all cells share one root stream
+        seed = np.random.SeedSequence().entropy
+    if checkpointFilename is not None:
+        settings = {'numRuns':numRuns,'tFinal':tFinal,'deltat':deltat,
+                    'method':method,'backend':backend,
+                    'decisionThreshold':decisionThreshold,'seed':seed}
+        if resuming:
+            # (compare after a JSON round trip, e.g. for tuple vs. list)
+            if previousSettings != json.loads(json.dumps(settings)):
+                raise Exception("Checkpoint file {} does not match the "
+                    "requested settings: {} != {}".format(checkpointFilename,
+                    previousSettings,settings))
+            if os.path.getsize(checkpointFilename) > 0:
+                previousResults = pd.read_csv(checkpointFilename,
+                                              float_precision='round_trip')
+            else: # (interrupted before the header was written)
+                previousResults = _emptySweepResults()
+            previousResults = previousResults.dropna(subset=['cell'])
+            previousResults['cell'] = previousResults['cell'].astype(int)
+            for cell,cellResults in previousResults.groupby('cell'):
+                parameters = tuple(cellResults[sweepParameterNames].iloc[0])
+                if cell >= len(grid) or not np.allclose(parameters,grid[cell]):
+                    raise Exception("Checkpoint file {} does not match the "
+                        "requested parameter grid.".format(checkpointFilename))
+                # only count cells with all runs recorded as completed
+                complete = len(cellResults) == numRuns and not np.any(
+                    cellResults[['run','finalMeanState']].isna().values)
+                if complete:
+                    resultList.append(cellResults.astype(
+                        {'N':int,'run':int,'decision':int}))
+                    completedCells.add(cell)
+            # rewrite the file once, keeping only completed cells, so that
+            # rows of interrupted cells are not mixed with their reruns
+            _replaceFile(checkpointFilename,
+                lambda f: _emptySweepResults().to_csv(f,index=False)
+                          if len(resultList) == 0 else
+                          pd.concat(resultList).to_csv(f,index=False))
+        else:
+            _replaceFile(settingsFilename,
+                         lambda f: json.dump(settings,f))
+    tasks = [ (cell,) + parameters
+              + (numRuns,tFinal,deltat,method,backend,decisionThreshold,seed)
+              for cell,parameters in enumerate(grid)
+              if cell not in completedCells ]
+    
+    def record(cellResults):
+        resultList.append(cellResults)
+        if checkpointFilename is not None:
+            # append, so that checkpointing each cell takes constant time
+            # (a cell left incomplete by an interruption is rerun when
+            # resuming)
+            writeHeader = not os.path.exists(checkpointFilename)
+            with open(checkpointFilename,'a') as f:
+                cellResults.to_csv(f,header=writeHeader,index=False)
+                f.flush()
+                os.fsync(f.fileno())
+    
+    if numProcesses == 1:
+        for task in tasks:
+            record(_decisionSweepCell(task))
+    elif len(tasks) > 0:
+        with multiprocessing.Pool(numProcesses) as pool:
+            for cellResults in pool.imap_unordered(_decisionSweepCell,tasks):
+                record(cellResults)
+    
+    if len(resultList) == 0:
+        return _emptySweepResults()
+    df = pd.concat(resultList,ignore_index=True)
+    return df.sort_values(['cell','run'],ignore_index=True)
+
+def _emptySweepResults():
+    return pd.DataFrame(columns=sweepParameterNames+['cell','run',
+                        'finalMeanState','decision','correct','decisionTime'])
+
+def _replaceFile(filename,write):
+    """
+    Call write(f) on a temporary file, then replace filename with it.
+    """
+    tempFilename = filename + '.tmp{}'.format(os.getpid())
+    with open(tempFilename,'w') as f:
+        write(f)
+    os.replace(tempFilename,filename)
+
+def _decisionSweepCell(task):
+    """
+    Simulate a single cell of decisionSweep.  (Defined at the module level
+    so that it can be sent to worker processes.)
+    """
+    cell,inputConst,noiseVar,coupling,N,numRuns,tFinal,deltat,method,  \
+        backend,decisionThreshold,seed = task
+    
+    # derive an independent random stream for this cell
+    cellSeed = np.random.SeedSequence(seed,spawn_key=(cell,))
+    
+    weightMatrix = coupling*allToAllNetworkAdjacency(N)
+    if decisionThreshold is None:
+        # record only the initial and final states
+        recordEvery = max(1,_numTimes(tFinal,deltat)-1)
+        states = simpleNeuralDynamicsEnsemble(weightMatrix,numRuns=numRuns,
+                                              inputConst=inputConst,
+                                              noiseVar=noiseVar,tFinal=tFinal,
+                                              deltat=deltat,recordEvery=recordEvery,
+                                              returnArray=True,seed=cellSeed,
+                                              method=method,backend=backend)
+        finalStates = states[:,-1,:]
+        decisionTime = np.nan*np.ones(numRuns)
+    else:
+        decisions = simpleNeuralDecisions(weightMatrix,numRuns=numRuns,
+                                          threshold=decisionThreshold,
+                                          inputConst=inputConst,
+                                          noiseVar=noiseVar,tFinal=tFinal,
+                                          deltat=deltat,seed=cellSeed,
+                                          method=method,backend=backend)
+        finalStates = decisions.iloc[:,2:].values
+        decisionTime = decisions['Decision time'].values
+    finalMeanState = np.mean(finalStates,axis=1)
+    decision = np.where(finalMeanState > 0,1,-1)
+    if inputConst == 0:
+        correct = np.nan*np.ones(numRuns)
+    else:
+        correct = (decision == np.sign(inputConst)).astype(float)
+    
+    return pd.DataFrame({'inputConst':inputConst,
+                         'noiseVar':noiseVar,
+                         'coupling':coupling,
+                         'N':N,
+                         'cell':cell,
+                         'run':np.arange(numRuns),
+                         'finalMeanState':finalMeanState,
+                         'decision':decision,
+                         'correct':correct,
+                         'decisionTime':decisionTime})
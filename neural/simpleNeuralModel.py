@@ -13,10 +13,25 @@
 
 import numpy as np
 import scipy.optimize as opt
+import scipy.sparse
+import scipy.sparse.linalg
+import scipy.sparse.csgraph
+import scipy.spatial
 import pandas as pd
+try:
+    import networkx as nx
+except ImportError: # networkx is only needed to pass graphs as weight matrices
+    nx = None
+try:
+    import numba
+except ImportError: # numba is only needed for backend='numba'
+    numba = None
+import warnings
 
 def simpleNeuralDynamics(weightMatrix,inputConst=0,noiseVar=1,
-    tFinal=10,deltat=1e-3,initialState=None):
+    tFinal=10,deltat=1e-3,initialState=None,recordEvery=1,dtype=float,
+    returnArray=False,seed=None,method='euler',tolerance=1e-3,
+    returnNumSteps=False,backend='numpy'):
     """
     Simulates the following stochastic process:
     
@@ -27,71 +42,839 @@ def simpleNeuralDynamics(weightMatrix,inputConst=0,noiseVar=1,
     Time is discretized into units of deltat, and the simulation is run until time tFinal.
     
     weightMatrix                      : (N x N) matrix indicating the synaptic strength from
-                                        neuron j to neuron i
+                                        neuron j to neuron i.  May be a numpy array, a
+                                        scipy.sparse matrix, or a networkx graph (see
+                                        weightMatrixArray).  Sparse matrices and graphs
+                                        are simulated using sparse matrix products.
     initialState (None)               : If given a list of length N, start the system in the
                                         given state.  If None, initial state defaults to
                                         all zeros.
+    recordEvery (1)                   : Record the state only every recordEvery timesteps
+                                        (the state at time 0 is always recorded).
+    dtype (float)                     : Data type used to store recorded states.  Using
+                                        np.float32 halves memory use.  (The simulation
+                                        itself is always run in double precision.)
+    returnArray (False)               : If True, return a (#recorded times x N) numpy
+                                        array instead of a pandas dataframe.  Row k
+                                        corresponds to time k*recordEvery*deltat.
+    seed (None)                       : Seed for the noise, given as an integer, a
+                                        np.random.SeedSequence, or a np.random.Generator.
+                                        If None, numpy's global random state is used.
+    method ('euler')                  : Integration method, one of
+                                        'euler'       : Euler-Maruyama (strong order 1/2)
+                                        'exponential' : Exponential Euler, which treats
+                                                        the linear -x_i term (and the
+                                                        noise it filters) exactly, and
+                                                        so remains stable and accurate
+                                                        for larger deltat
+                                        'heun'        : Stochastic Heun, strong order 1
+                                                        for this (additive) noise
+                                        'adaptive'    : Stochastic Heun with adaptive
+                                                        step size.  Steps are chosen
+                                                        such that the estimated local
+                                                        error (from step doubling) is
+                                                        less than tolerance, with the
+                                                        noise path kept consistent
+                                                        across rejected steps.  States
+                                                        are still recorded at multiples
+                                                        of recordEvery*deltat, and
+                                                        deltat sets the initial step.
+    tolerance (1e-3)                  : Absolute error tolerance per step for the
+                                        'adaptive' method
+    returnNumSteps (False)            : If True, return (output,numSteps), where
+                                        numSteps is the number of integration steps
+                                        taken (for 'adaptive', the number of accepted
+                                        steps).
+    backend ('numpy')                 : 'numpy' or 'numba'.  For the 'euler' and
+                                        'exponential' methods, 'numba' runs each
+                                        timestep as a single compiled loop over
+                                        preallocated buffers, with noise from numba's
+                                        own random stream (seeded from seed).  This
+                                        removes most per-step overhead for small
+                                        networks with few replicates (for large
+                                        ensembles, numpy's matrix products may be
+                                        faster).  Results are statistically
+                                        identical to, but not the same numbers as,
+                                        the 'numpy' backend.  If numba is not
+                                        installed, a buffered pure-numpy version of
+                                        the same update is used instead.
+    
+    For simulations too long to hold in memory, see simpleNeuralDynamicsChunks.
+    """
+    # a single run is an ensemble with one replicate, recorded in one chunk
+    times,states,numSteps = next(_simulationChunks(weightMatrix,1,inputConst,
+                                          noiseVar,tFinal,deltat,initialState,
+                                          recordEvery=recordEvery,dtype=dtype,
+                                          seed=seed,method=method,
+                                          tolerance=tolerance,backend=backend))
+    
+    if returnArray:
+        output = states[0]
+    else:
+        output = _simulationDataFrame(times,states[0])
+    if returnNumSteps:
+        return output,numSteps
+    return output
+
+def simpleNeuralDynamicsEnsemble(weightMatrix,numRuns=10,inputConst=0,
+    noiseVar=1,tFinal=10,deltat=1e-3,initialState=None,recordEvery=1,
+    dtype=float,returnArray=False,seed=None,method='euler',tolerance=1e-3,
+    returnNumSteps=False,backend='numpy'):
+    """
+    Simulates numRuns independent replicates of the stochastic process
+    described in simpleNeuralDynamics.
+    
+    All replicates are advanced together as a (numRuns x N) block of states,
+    using a single matrix-matrix product per timestep, which is much faster
+    than calling simpleNeuralDynamics numRuns times.
+    
+    numRuns (10)                      : Number of independent replicates
+    initialState (None)               : If given a list of length N, start every
+                                        replicate in the given state.  If given a
+                                        (numRuns x N) array, start each replicate in
+                                        the corresponding row.  If None, initial
+                                        state defaults to all zeros.
+    returnArray (False)               : If True, return a
+                                        (numRuns x #recorded times x N) numpy array
+                                        instead of a pandas dataframe.
+    
+    recordEvery, dtype, seed, method, tolerance, returnNumSteps, and backend
+    are as in simpleNeuralDynamics.  (With the 'adaptive' method, all replicates share
+    the same step sizes, chosen using the largest error among replicates.)
+    
+    Returns a pandas dataframe with a (Run, Time) MultiIndex, so that the data
+    for run r (in the format returned by simpleNeuralDynamics) is df.loc[r].
+    """
+    times,states,numSteps = next(_simulationChunks(weightMatrix,numRuns,
+                                          inputConst,noiseVar,tFinal,deltat,
+                                          initialState,recordEvery=recordEvery,
+                                          dtype=dtype,seed=seed,method=method,
+                                          tolerance=tolerance,backend=backend))
+    
+    if returnArray:
+        output = states
+    else:
+        output = _simulationDataFrame(times,states,runs=np.arange(numRuns))
+    if returnNumSteps:
+        return output,numSteps
+    return output
+
+def simpleNeuralDynamicsChunks(weightMatrix,chunkSize=10000,numRuns=None,
+    inputConst=0,noiseVar=1,tFinal=10,deltat=1e-3,initialState=None,
+    recordEvery=1,dtype=float,returnArray=False,seed=None,method='euler',
+    tolerance=1e-3,returnNumSteps=False,backend='numpy'):
+    """
+    Generator version of simpleNeuralDynamics that yields the simulation
+    output in consecutive chunks of chunkSize recorded times, so that
+    memory use is bounded by chunkSize no matter how long the simulation.
+    
+    chunkSize (10000)                 : Number of recorded times per chunk
+    numRuns (None)                    : If None, simulate a single run, yielding
+                                        chunks in the format of simpleNeuralDynamics.
+                                        If an integer, simulate an ensemble, yielding
+                                        chunks in the format of
+                                        simpleNeuralDynamicsEnsemble.
+    returnArray (False)               : If True, yield (times,states) tuples of
+                                        numpy arrays instead of pandas dataframes.
+    returnNumSteps (False)            : If True, yield (chunk,numSteps) tuples, where
+                                        numSteps is the number of integration steps
+                                        taken so far.
+    
+    Other arguments are as in simpleNeuralDynamics.
+    
+    Example: keep only the mean activity over a long simulation
+        meanActivity = pd.concat([ chunk.mean(axis=1) for chunk in
+            simpleNeuralDynamicsChunks(weightMatrix,tFinal=3600) ])
+    """
+    singleRun = numRuns is None
+    if singleRun: numRuns = 1
+    for times,states,numSteps in _simulationChunks(weightMatrix,numRuns,
+                                          inputConst,noiseVar,tFinal,deltat,
+                                          initialState,recordEvery=recordEvery,
+                                          chunkSize=chunkSize,dtype=dtype,
+                                          seed=seed,method=method,
+                                          tolerance=tolerance,backend=backend):
+        if singleRun:
+            states = states[0]
+        if returnArray:
+            chunk = (times,states)
+        elif singleRun:
+            chunk = _simulationDataFrame(times,states)
+        else:
+            chunk = _simulationDataFrame(times,states,runs=np.arange(numRuns))
+        if returnNumSteps:
+            yield chunk,numSteps
+        else:
+            yield chunk
+
+def simpleNeuralDecisions(weightMatrix,numRuns=1,threshold=None,
+    stopCondition=None,checkEvery=1,inputConst=0,noiseVar=1,tFinal=10,
+    deltat=1e-3,initialState=None,seed=None,method='euler',tolerance=1e-3,
+    backend='numpy'):
+    """
+    Simulates numRuns replicates of simpleNeuralDynamics, stopping each run
+    as soon as it reaches a decision, and returns only decision times and
+    final states (without storing trajectories).
+    
+    Runs that have stopped are removed from the block of simulated states,
+    so that the cost of the simulation shrinks as decisions are made.
+    
+    threshold (None)                  : Stop a run when the absolute value of its
+                                        mean neural state reaches threshold.
+    stopCondition (None)              : A function taking a (#runs x N) array of
+                                        states and returning a boolean array of
+                                        length #runs that is True for runs that
+                                        should stop.  Used in addition to threshold.
+    checkEvery (1)                    : Check stopping conditions every checkEvery
+                                        timesteps (and at time 0).  Decision times
+                                        are thus resolved to checkEvery*deltat.
+    
+    Other arguments are as in simpleNeuralDynamicsEnsemble.
+    
+    Returns a pandas dataframe indexed by Run, with columns
+    'Decision time'   : Time at which the run stopped (nan if it did not stop
+                        before tFinal)
+    'Decision'        : Sign of the mean neural state at the final time
+    'Neuron i'        : Final state of each neuron (at the decision time,
+                        or at tFinal for runs that did not stop)
     """
-    N = len(weightMatrix)
+    if threshold is None and stopCondition is None:
+        raise Exception("Specify a threshold and/or a stopCondition.")
+    weightMatrix = weightMatrixArray(weightMatrix)
+    N = weightMatrix.shape[0]
+    rng = np.random if seed is None else np.random.default_rng(seed)
+    
+    def stops(x):
+        stop = np.zeros(len(x),dtype=bool)
+        if threshold is not None:
+            stop |= abs(np.mean(x,axis=1)) >= threshold
+        if stopCondition is not None:
+            stop |= np.asarray(stopCondition(x),dtype=bool)
+        return stop
+    
+    # set up the initial (numRuns x N) state
+    if initialState is None:
+        initialState = np.zeros(N)
+    currentState = np.array(initialState,dtype=float)
+    if currentState.ndim == 1:
+        assert(len(currentState)==N)
+        currentState = np.tile(currentState,(numRuns,1))
+    assert(currentState.shape==(numRuns,N))
+    
+    finalStates = np.empty((numRuns,N))
+    decisionTimes = np.nan*np.ones(numRuns)
+    activeRuns = np.arange(numRuns)
+    
+    integrator = _integrator(method,weightMatrix,inputConst,noiseVar,deltat,
+                             checkEvery,rng,tolerance,backend)
+    numTimes = _numTimes(tFinal,deltat)
+    i = 0 # index of the current timestep
+    while True:
+        # remove runs that have stopped
+        stopped = stops(currentState)
+        if np.any(stopped):
+            finalStates[activeRuns[stopped]] = currentState[stopped]
+            decisionTimes[activeRuns[stopped]] = i*deltat
+            currentState = currentState[~stopped]
+            integrator.selectRuns(~stopped)
+            activeRuns = activeRuns[~stopped]
+        if len(activeRuns) == 0 or i == numTimes-1:
+            break
+        
+        # integrate to the next check (or to the final time)
+        numSteps = min(checkEvery,numTimes-1-i)
+        currentState,_ = integrator.advance(currentState,numSteps)
+        i += numSteps
+    finalStates[activeRuns] = currentState
+    
+    df = pd.DataFrame(finalStates,columns=neuronNames(N))
+    df.insert(0,'Decision',np.sign(np.mean(finalStates,axis=1)))
+    df.insert(0,'Decision time',decisionTimes)
+    df.index.set_names('Run',inplace=True)
+    return df
+
+def weightMatrixArray(weightMatrix):
+    """
+    Return weightMatrix as a square numpy array or, if it is sparse, as a
+    scipy.sparse CSR matrix.
+    
+    A networkx graph is converted to a sparse matrix with nodes in the order
+    given by G.nodes(), such that weightMatrix_{i,j} is the 'weight' attribute
+    (defaulting to 1) of the edge from node j to node i.
+    """
+    if nx is not None and isinstance(weightMatrix,nx.Graph):
+        # networkx adjacency A_{j,i} refers to the edge j -> i
+        weightMatrix = nx.to_scipy_sparse_array(weightMatrix,format='csr').T
+    if scipy.sparse.issparse(weightMatrix):
+        weightMatrix = weightMatrix.tocsr()
+    else:
+        weightMatrix = np.asarray(weightMatrix)
     # make sure the weight matrix is square
-    assert(len(weightMatrix[0])==N)
+    assert(len(weightMatrix.shape)==2)
+    assert(weightMatrix.shape[0]==weightMatrix.shape[1])
+    return weightMatrix
+
+def _interaction(weightMatrix,states):
+    """
+    The interaction term sum_j weightMatrix_{i,j} tanh(x_j), computed for
+    a single state of length N or for each row of a (#runs x N) block of
+    states.  Works for both dense and sparse weight matrices.
+    """
+    return weightMatrix.dot(np.tanh(states).T).T
+
+def neuronNames(N):
+    return ['Neuron {}'.format(i) for i in range(N)]
+
+def _simulationDataFrame(times,states,runs=None):
+    """
+    Convert recorded states to a pandas dataframe with one column per neuron.
     
-    # set up the initial state
+    If runs is None, states has shape (#times x N) and is indexed by Time.
+    Otherwise states has shape (#runs x #times x N) and is indexed by
+    (Run, Time).
+    """
+    N = states.shape[-1]
+    if runs is None:
+        df = pd.DataFrame(states,index=times,columns=neuronNames(N))
+        df.index.set_names('Time',inplace=True)
+    else:
+        idx = pd.MultiIndex.from_product([runs,times],names=['Run','Time'])
+        df = pd.DataFrame(states.reshape(len(runs)*len(times),N),
+                          index=idx,columns=neuronNames(N))
+    return df
+
+def _numTimes(tFinal,deltat):
+    """
+    Number of simulation times, equal to len(np.arange(0,tFinal+deltat,deltat))
+    but without constructing the array.
+    """
+    return int(np.ceil((tFinal+deltat)/deltat))
+
+def _simulationChunks(weightMatrix,numRuns,inputConst,noiseVar,tFinal,deltat,
+    initialState,recordEvery=1,chunkSize=None,dtype=float,seed=None,
+    method='euler',tolerance=1e-3,backend='numpy'):
+    """
+    Integration of numRuns replicates at once.
+    
+    Yields (times,states,numSteps) for consecutive chunks of recorded times,
+    where states has shape (numRuns x #times in chunk x N) and numSteps is
+    the number of integration steps taken so far.  States are recorded
+    every recordEvery timesteps into preallocated buffers holding chunkSize
+    recorded times each.  If chunkSize is None, everything is recorded into
+    a single buffer.
+    
+    Noise is drawn from np.random.default_rng(seed), or from numpy's global
+    random state if seed is None.
+    """
+    weightMatrix = weightMatrixArray(weightMatrix)
+    N = weightMatrix.shape[0]
+    rng = np.random if seed is None else np.random.default_rng(seed)
+    
+    # set up the initial (numRuns x N) state
     if initialState is None:
         initialState = np.zeros(N)
-    # make sure the initial state has the correct length
-    assert(len(initialState)==N)
+    initialState = np.array(initialState,dtype=float)
+    if initialState.ndim == 1:
+        # make sure the initial state has the correct length
+        assert(len(initialState)==N)
+        initialState = np.tile(initialState,(numRuns,1))
+    assert(initialState.shape==(numRuns,N))
+    
+    # set up the timesteps to be recorded
+    numTimes = _numTimes(tFinal,deltat)
+    numRecorded = (numTimes-1)//recordEvery + 1
+    if chunkSize is None:
+        chunkSize = numRecorded
     
-    # set up the simulation times and a list to hold the simulated steps
-    times = np.arange(0,tFinal+deltat,deltat)
-    stateList = [initialState,]
+    # set up the integrator, which advances the state by one recorded interval
+    integrator = _integrator(method,weightMatrix,inputConst,noiseVar,deltat,
+                             recordEvery,rng,tolerance,backend)
+    
+    # the state at t=0 is the first recorded state
+    currentState = initialState
+    buffer = np.empty((numRuns,min(chunkSize,numRecorded),N),dtype=dtype)
+    buffer[:,0,:] = currentState
+    numInBuffer,numSteps = 1,0
     
     # run the simulation (we already have the state for t=0)
-    for time in times[1:]:
-        currentState = stateList[-1]
-        
-        # compute deltax for current timestep
-        deterministicPart = deltat*( inputConst - currentState + np.dot(weightMatrix,np.tanh(currentState)) )
-        stochasticPart = np.sqrt(deltat*noiseVar)*np.random.normal(size=N)
-        deltax = deterministicPart + stochasticPart
+    for k in range(1,numRecorded):
         
-        # update to find the new state
-        newState = currentState + deltax
+        # integrate to the next recorded time
+        currentState,numIntervalSteps = integrator.advance(currentState)
+        numSteps += numIntervalSteps
         
         # record the new state
-        stateList.append(newState)
-       
-    # return simulation output as a pandas dataframe
-    df = pd.DataFrame(stateList,index=times,columns=['Neuron {}'.format(i) for i in range(N)])
-    df.index.set_names('Time',inplace=True)
-    return df
+        if numInBuffer == buffer.shape[1]:
+            # buffer is full: hand it off and start a new one
+            yield _chunkTimes(k-numInBuffer,numInBuffer,recordEvery,deltat), \
+                  buffer,numSteps
+            buffer = np.empty((numRuns,min(chunkSize,numRecorded-k),N),dtype=dtype)
+            numInBuffer = 0
+        buffer[:,numInBuffer,:] = currentState
+        numInBuffer += 1
+    
+    yield _chunkTimes(numRecorded-numInBuffer,numInBuffer,recordEvery,deltat), \
+          buffer,numSteps
+
+integrationMethods = ['euler','exponential','heun','adaptive']
+
+def _integrator(method,weightMatrix,inputConst,noiseVar,deltat,numSteps,rng,
+    tolerance,backend='numpy'):
+    """
+    Returns an integrator whose advance method takes a (#runs x N) block of
+    states and integrates it forward by time numSteps*deltat, returning the
+    new states and the number of integration steps taken.
+    """
+    if method not in integrationMethods:
+        raise Exception("Unrecognized integration method: "+str(method))
+    if backend not in ['numpy','numba']:
+        raise Exception("Unrecognized backend: "+str(backend))
+    if backend == 'numba':
+        if method not in ['euler','exponential']:
+            raise Exception("The numba backend supports only the 'euler' "
+                            "and 'exponential' methods.")
+        if numba is None:
+            warnings.warn("numba is not installed; using buffered numpy "
+                          "integration instead.")
+        return _fusedLinearStepIntegrator(method,weightMatrix,inputConst,
+                                          noiseVar,deltat,numSteps,rng)
+    forcing = lambda x: inputConst + _interaction(weightMatrix,x)
+    drift = lambda x: forcing(x) - x
+    
+    if method == 'adaptive':
+        return _adaptiveHeunIntegrator(drift,noiseVar,deltat,numSteps,
+                                       tolerance,rng)
+    
+    if method == 'euler':
+        noiseScale = np.sqrt(deltat*noiseVar)
+        def step(x):
+            deterministicPart = deltat*( inputConst - x
+                                        + _interaction(weightMatrix,x) )
+            stochasticPart = noiseScale*rng.normal(size=x.shape)
+            return x + deterministicPart + stochasticPart
+    elif method == 'exponential':
+        # integrate dx/dt = -x + forcing exactly, holding forcing constant over
+        # the step; the noise then has the exact Ornstein-Uhlenbeck variance
+        decay = np.exp(-deltat)
+        noiseScale = np.sqrt(noiseVar*(1.-decay**2)/2.)
+        def step(x):
+            return decay*x + (1.-decay)*forcing(x) \
+                   + noiseScale*rng.normal(size=x.shape)
+    elif method == 'heun':
+        noiseScale = np.sqrt(deltat*noiseVar)
+        def step(x):
+            return _heunStep(drift,x,deltat,noiseScale*rng.normal(size=x.shape))
+    return _fixedStepIntegrator(step,numSteps)
+
+class _fixedStepIntegrator():
+    """
+    Applies the function step numSteps times per call to advance.
+    """
+    def __init__(self,step,numSteps):
+        self.step = step
+        self.numSteps = numSteps
+    
+    def advance(self,x,numSteps=None):
+        if numSteps is None: numSteps = self.numSteps
+        for i in range(numSteps):
+            x = self.step(x)
+        return x,numSteps
+    
+    def selectRuns(self,keep):
+        """
+        Called when runs are removed from the block of states (here there
+        is no per-run state to update).
+        """
+        pass
+
+class _fusedLinearStepIntegrator():
+    """
+    Integrator for the 'euler' and 'exponential' methods, both of which
+    have the form
+    
+    x_new = a x + b (inputConst + sum_j W_{i,j} tanh(x_j)) + c xi
+    
+    with xi standard normal noise.  With numba installed, each call to
+    advance runs a single compiled loop; otherwise, each step is computed
+    in place using preallocated numpy buffers.
+    """
+    def __init__(self,method,weightMatrix,inputConst,noiseVar,deltat,numSteps,
+        rng):
+        if method == 'euler':
+            self.a = 1. - deltat
+            self.b = deltat
+            self.c = np.sqrt(deltat*noiseVar)
+        elif method == 'exponential':
+            decay = np.exp(-deltat)
+            self.a = decay
+            self.b = 1. - decay
+            self.c = np.sqrt(noiseVar*(1.-decay**2)/2.)
+        self.weightMatrix = weightMatrix
+        N = weightMatrix.shape[0]
+        self.inputConst = np.array(np.broadcast_to(inputConst,(N,)),dtype=float)
+        self.numSteps = numSteps
+        self.rng = rng
+        if numba is not None:
+            # seed numba's random stream from ours
+            if hasattr(rng,'integers'): seed = rng.integers(2**32)
+            else: seed = rng.randint(2**32)
+            _numbaSeed(seed)
+            self.tanhBuffer = np.empty(N)
+        self.buffersShape = None
+    
+    def selectRuns(self,keep):
+        pass
+    
+    def _setupBuffers(self,shape):
+        if self.buffersShape != shape:
+            self.interactionBuffer = np.empty(shape)
+            self.noiseBuffer = np.empty(shape)
+            self.buffersShape = shape
+    
+    def advance(self,x,numSteps=None):
+        if numSteps is None: numSteps = self.numSteps
+        x = np.array(x,dtype=float) # copy, since we update in place
+        a,b,c = self.a,self.b,self.c
+        W = self.weightMatrix
+        if numba is not None:
+            if scipy.sparse.issparse(W):
+                _numbaLinearStepsSparse(x,W.data,W.indices,W.indptr,
+                                        self.inputConst,a,b,c,numSteps,
+                                        self.tanhBuffer)
+            else:
+                _numbaLinearStepsDense(x,W,self.inputConst,a,b,c,numSteps,
+                                       self.tanhBuffer)
+            return x,numSteps
+        
+        self._setupBuffers(x.shape)
+        interaction,noise = self.interactionBuffer,self.noiseBuffer
+        for i in range(numSteps):
+            if scipy.sparse.issparse(W):
+                interaction[:] = _interaction(W,x)
+            else:
+                np.tanh(x,out=noise)
+                np.dot(noise,W.T,out=interaction)
+            if isinstance(self.rng,np.random.Generator):
+                self.rng.standard_normal(out=noise)
+            else: # numpy's global random state cannot fill a buffer
+                noise[:] = self.rng.normal(size=x.shape)
+            interaction += self.inputConst
+            interaction *= b
+            noise *= c
+            x *= a
+            x += interaction
+            x += noise
+        return x,numSteps
+
+if numba is not None:
+    @numba.njit
+    def _numbaSeed(seed):
+        np.random.seed(seed)
+    
+    @numba.njit
+    def _numbaLinearStepsDense(x,W,inputConst,a,b,c,numSteps,tanhBuffer):
+        numRuns,N = x.shape
+        for step in range(numSteps):
+            for r in range(numRuns):
+                for j in range(N):
+                    tanhBuffer[j] = np.tanh(x[r,j])
+                for i in range(N):
+                    interaction = 0.
+                    for j in range(N):
+                        interaction += W[i,j]*tanhBuffer[j]
+                    x[r,i] = a*x[r,i] + b*(inputConst[i] + interaction) \
+                             + c*np.random.standard_normal()
+    
+    @numba.njit
+    def _numbaLinearStepsSparse(x,data,indices,indptr,inputConst,a,b,c,
+        numSteps,tanhBuffer):
+        numRuns,N = x.shape
+        for step in range(numSteps):
+            for r in range(numRuns):
+                for j in range(N):
+                    tanhBuffer[j] = np.tanh(x[r,j])
+                for i in range(N):
+                    interaction = 0.
+                    for k in range(indptr[i],indptr[i+1]):
+                        interaction += data[k]*tanhBuffer[indices[k]]
+                    x[r,i] = a*x[r,i] + b*(inputConst[i] + interaction) \
+                             + c*np.random.standard_normal()
+
+def _heunStep(drift,x,deltat,noise):
+    """
+    One stochastic Heun step, given the noise increment for the step.
+    """
+    driftX = drift(x)
+    predictor = x + deltat*driftX + noise
+    return x + 0.5*deltat*(driftX + drift(predictor)) + noise
+
+class _adaptiveHeunIntegrator():
+    """
+    Stochastic Heun integration with step sizes adapted to keep the local
+    error, estimated by comparing one full step to two half steps, below an
+    absolute tolerance.
+    
+    The Brownian increments of rejected steps are not discarded (which would
+    bias the noise) but split using Brownian bridges and kept on a stack of
+    pending (duration, increment) segments, so that the simulated noise path
+    stays consistent.  (This is the "rejection sampling with memory"
+    approach of Rackauckas and Nie, 2017.)
+    """
+    def __init__(self,drift,noiseVar,deltat,numSteps,tolerance,rng,
+        maxFactor=2.):
+        self.drift = drift
+        self.noiseStd = np.sqrt(noiseVar)
+        self.deltat = deltat
+        self.numSteps = numSteps
+        self.stepSize = deltat
+        self.tolerance = tolerance
+        self.rng = rng
+        self.maxFactor = maxFactor
+        self.pending = []
+    
+    def _brownianIncrement(self,h,shape):
+        """
+        Return (duration,increment) for the next Brownian segment of
+        duration at most h, taken from pending segments if there are any.
+        """
+        if len(self.pending) == 0:
+            return h,np.sqrt(h)*self.rng.normal(size=shape)
+        duration,increment = self.pending.pop()
+        if h < duration:
+            # split the pending segment with a Brownian bridge
+            firstPart = h/duration*increment \
+                + np.sqrt(h*(duration-h)/duration)*self.rng.normal(size=shape)
+            self.pending.append((duration-h,increment-firstPart))
+            return h,firstPart
+        return duration,increment
+    
+    def selectRuns(self,keep):
+        """
+        Remove runs from the pending noise path, where keep is a boolean
+        array indicating which rows of the block of states remain.
+        """
+        self.pending = [ (duration,increment[keep])
+                         for duration,increment in self.pending ]
+    
+    def advance(self,x,numSteps=None):
+        """
+        Integrate forward by time numSteps*deltat.
+        """
+        if numSteps is None: numSteps = self.numSteps
+        totalTime = numSteps*self.deltat
+        t,numSteps = 0.,0
+        while totalTime - t > 1e-12*totalTime:
+            h,dW = self._brownianIncrement(min(self.stepSize,totalTime-t),x.shape)
+            # split the increment in two halves with a Brownian bridge
+            dW1 = 0.5*dW + np.sqrt(h/4.)*self.rng.normal(size=x.shape)
+            dW2 = dW - dW1
+            fullStep = _heunStep(self.drift,x,h,self.noiseStd*dW)
+            halfSteps = _heunStep(self.drift,
+                            _heunStep(self.drift,x,h/2.,self.noiseStd*dW1),
+                            h/2.,self.noiseStd*dW2)
+            error = np.max(abs(fullStep - halfSteps))
+            if error <= self.tolerance:
+                # accept, keeping the more accurate estimate
+                x = halfSteps
+                t += h
+                numSteps += 1
+                if error == 0.:
+                    factor = self.maxFactor
+                else:
+                    # local error scales as h^(3/2)
+                    factor = min(self.maxFactor,0.9*(self.tolerance/error)**(2./3.))
+                self.stepSize = h*factor
+            else:
+                # reject, saving the noise path for the two half steps
+                self.pending.append((h/2.,dW2))
+                self.pending.append((h/2.,dW1))
+                self.stepSize = h/2.
+        return x,numSteps
+
+def _chunkTimes(firstRecordedIndex,numInChunk,recordEvery,deltat):
+    """
+    Times corresponding to a chunk of recorded states
+    """
+    recordedIndices = np.arange(firstRecordedIndex,firstRecordedIndex+numInChunk)
+    return recordedIndices*recordEvery*deltat
 
 def allToAllNetworkAdjacency(N):
     return 1 - np.eye(N)
 
-def findFixedPoint(weightMatrix,initialGuessState,inputConst=0):
+def deterministicJacobian(weightMatrix,state):
+    """
+    Jacobian of the deterministic part of dynamics at the given state:
+    
+    J_{i,j} = -delta_{i,j} + weightMatrix_{i,j} sech^2(x_j)
+    
+    Returns a scipy.sparse matrix if weightMatrix is sparse.
+    """
+    weightMatrix = weightMatrixArray(weightMatrix)
+    sech2 = 1. - np.tanh(state)**2
+    if scipy.sparse.issparse(weightMatrix):
+        N = weightMatrix.shape[0]
+        return (weightMatrix.multiply(sech2[np.newaxis,:])
+                - scipy.sparse.identity(N)).tocsr()
+    return weightMatrix*sech2[np.newaxis,:] - np.eye(len(state))
+
+def findFixedPoint(weightMatrix,initialGuessState,inputConst=0,
+    maxIterations=100,tolerance=1e-10):
     """
     Find a fixed point of the deterministic part of dynamics
+    
+    For a sparse weightMatrix, uses Newton's method with each linear step
+    solved iteratively (GMRES) using the sparse Jacobian, stopping when all
+    components of dx/dt are smaller than tolerance or after maxIterations
+    steps.  For a dense weightMatrix, uses scipy.optimize.root with the
+    analytic Jacobian.
     """
-    deterministicDeltaX = lambda x: inputConst - x + np.dot(weightMatrix,np.tanh(x))
-    sol = opt.root(deterministicDeltaX,initialGuessState)
-    return sol.x
+    weightMatrix = weightMatrixArray(weightMatrix)
+    deterministicDeltaX = lambda x: inputConst - x + _interaction(weightMatrix,x)
+    jacobian = lambda x: deterministicJacobian(weightMatrix,x)
+    if not scipy.sparse.issparse(weightMatrix):
+        sol = opt.root(deterministicDeltaX,initialGuessState,jac=jacobian)
+        return sol.x
+    x = np.array(initialGuessState,dtype=float)
+    for i in range(maxIterations):
+        deltaX = deterministicDeltaX(x)
+        if np.max(abs(deltaX)) < tolerance:
+            break
+        step,info = scipy.sparse.linalg.gmres(jacobian(x),-deltaX)
+        x = x + step
+    return x
 
 def findFixedPoints(weightMatrix,inputConst=0,useMeanField=True,startMin=-10,
-    startMax=10,numToTest=100):
+    startMax=10,numToTest=100,mergeTolerance=1e-5,returnStability=False):
     """
     look for all fixed points nearby a set of starting points
+    
+    Newton's method is run from all starting points at once, using the
+    analytic Jacobian (see deterministicJacobian).  Starting points that do
+    not converge are discarded, and fixed points that differ by less than
+    mergeTolerance in every component are merged.
+    
+    returnStability (False)           : If True, add columns 'Max eigenvalue',
+                                        the largest real part of the Jacobian's
+                                        eigenvalues, and 'Stability', one of
+                                        'stable', 'unstable', or 'marginal'
+                                        (see fixedPointStability).
     """
-    N = len(weightMatrix)
-    fixedPointList = []
-    if useMeanField and np.mean(np.sum(weightMatrix,axis=0)) > 1.:
-        xMF = 2.*np.sqrt(np.mean(np.sum(weightMatrix,axis=0))-1.)
+    weightMatrix = weightMatrixArray(weightMatrix)
+    N = weightMatrix.shape[0]
+    meanInputStrength = np.mean(weightMatrix.sum(axis=0))
+    if useMeanField and meanInputStrength > 1.:
+        xMF = 2.*np.sqrt(meanInputStrength-1.)
         startingPoints = [-xMF,0.,+xMF]
     else:
         startingPoints = list(np.linspace(startMin,startMax,numToTest))
-    for startingPoint in startingPoints:
-        initialGuessState = startingPoint*np.ones(N)
-        fixedPoint = findFixedPoint(weightMatrix,initialGuessState,inputConst=inputConst)
-        fixedPointList.append(fixedPoint)
-    uniqueFixedPoints = np.unique(np.round(fixedPointList,5),axis=0)
-    return pd.DataFrame(uniqueFixedPoints,columns=['Neuron {}'.format(i) for i in range(N)])
+    initialGuessStates = np.outer(startingPoints,np.ones(N))
+    
+    if scipy.sparse.issparse(weightMatrix):
+        fixedPoints = np.array([ findFixedPoint(weightMatrix,initialGuessState,
+                                                inputConst=inputConst)
+                                 for initialGuessState in initialGuessStates ])
+        deltaX = inputConst - fixedPoints + _interaction(weightMatrix,fixedPoints)
+        converged = np.max(abs(deltaX),axis=1) < 1e-8
+    else:
+        fixedPoints,converged = _batchedNewton(weightMatrix,initialGuessStates,
+                                               inputConst)
+    uniqueFixedPoints = _mergeNearbyPoints(fixedPoints[converged],mergeTolerance)
+    
+    df = pd.DataFrame(uniqueFixedPoints,columns=neuronNames(N))
+    if returnStability:
+        maxEigenvalues,stabilities = zip(*[ fixedPointStability(weightMatrix,x)
+                                            for x in uniqueFixedPoints ])
+        df['Max eigenvalue'] = maxEigenvalues
+        df['Stability'] = stabilities
+    return df
+
+def fixedPointStability(weightMatrix,fixedPoint,eps=1e-8):
+    """
+    Classify the linear stability of a fixed point of the deterministic part
+    of dynamics using the eigenvalues of the Jacobian.
+    
+    Returns (maximum real part of eigenvalues, stability), where stability
+    is 'stable' if the maximum real part is less than -eps, 'unstable' if it
+    is greater than eps, and 'marginal' otherwise.
+    """
+    jacobian = deterministicJacobian(weightMatrix,np.asarray(fixedPoint))
+    if scipy.sparse.issparse(jacobian) and jacobian.shape[0] <= 10:
+        # (eigs requires k < N-1, and dense is faster for small N anyway)
+        jacobian = jacobian.toarray()
+    if scipy.sparse.issparse(jacobian):
+        # find only the eigenvalue with largest real part
+        eigenvalues = scipy.sparse.linalg.eigs(jacobian,k=1,which='LR',
+                                               return_eigenvectors=False)
+    else:
+        eigenvalues = np.linalg.eigvals(jacobian)
+    maxEigenvalue = np.max(np.real(eigenvalues))
+    if maxEigenvalue < -eps:
+        stability = 'stable'
+    elif maxEigenvalue > eps:
+        stability = 'unstable'
+    else:
+        stability = 'marginal'
+    return maxEigenvalue,stability
+
+def _batchedNewton(weightMatrix,initialGuessStates,inputConst=0,
+    maxIterations=100,tolerance=1e-10,maxBatchElements=2**24):
+    """
+    Newton's method for fixed points of the deterministic part of dynamics,
+    run simultaneously from each row of the (#starts x N) array
+    initialGuessStates, for a dense weightMatrix.
+    
+    Starting points are processed in batches such that the stacked
+    Jacobians contain at most about maxBatchElements entries.
+    
+    Returns (fixed points, converged), where converged is a boolean array
+    indicating which rows reached max |dx/dt| < tolerance.
+    """
+    N = weightMatrix.shape[0]
+    states = np.array(initialGuessStates,dtype=float)
+    converged = np.zeros(len(states),dtype=bool)
+    batchSize = max(1,maxBatchElements//N**2)
+    for batchStart in range(0,len(states),batchSize):
+        x = states[batchStart:batchStart+batchSize]
+        done = converged[batchStart:batchStart+batchSize]
+        # (one extra pass checks convergence after the final step)
+        for i in range(maxIterations+1):
+            deltaX = inputConst - x + _interaction(weightMatrix,x)
+            done[:] = np.max(abs(deltaX),axis=1) < tolerance
+            if np.all(done) or i == maxIterations:
+                break
+            # stacked Jacobians -I + W diag(sech^2 x) for unconverged rows
+            active = ~done
+            sech2 = 1. - np.tanh(x[active])**2
+            jacobians = weightMatrix[np.newaxis,:,:]*sech2[:,np.newaxis,:] \
+                        - np.eye(N)[np.newaxis,:,:]
+            try:
+                steps = np.linalg.solve(jacobians,-deltaX[active,:,np.newaxis])[:,:,0]
+            except np.linalg.LinAlgError: # a singular Jacobian; solve one by one
+                steps = np.array([ np.linalg.lstsq(J,-dx,rcond=None)[0]
+                                   for J,dx in zip(jacobians,deltaX[active]) ])
+            x[active] += steps
+    return states,converged
+
+def _mergeNearbyPoints(points,tolerance):
+    """
+    Merge rows of points that are within tolerance of each other in every
+    component (chaining together points connected by such neighbors),
+    replacing each group with its mean.  Uses a KD-tree to find neighbors.
+    
+    Returns merged points sorted in lexicographic order.
+    """
+    if len(points) == 0:
+        return points
+    tree = scipy.spatial.cKDTree(points)
+    pairs = tree.query_pairs(tolerance,p=np.inf,output_type='ndarray')
+    adjacency = scipy.sparse.coo_matrix(
+        (np.ones(len(pairs)),(pairs[:,0],pairs[:,1])),
+        shape=(len(points),len(points)))
+    numGroups,groups = scipy.sparse.csgraph.connected_components(adjacency,
+                                                                 directed=False)
+    groupSizes = np.bincount(groups,minlength=numGroups)
+    merged = np.zeros((numGroups,points.shape[1]))
+    np.add.at(merged,groups,points)
+    merged /= groupSizes[:,np.newaxis]
+    # sort as np.unique would
+    return merged[np.lexsort(merged.T[::-1])]